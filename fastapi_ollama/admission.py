@@ -0,0 +1,227 @@
+"""
+Admission control for the Ollama proxy.
+
+Ollama decodes only a few requests at once (OLLAMA_NUM_PARALLEL); anything
+beyond that waits inside Ollama with no bound and no timeout. The proxy
+keeps that waiting on its own side instead:
+
+* at most OLLAMA_PROXY_MAX_CONCURRENT requests per routable Ollama host are
+  forwarded at a time (resize() follows hosts being ejected and coming back),
+* up to OLLAMA_PROXY_MAX_QUEUE more wait, first come first served,
+* a request that has waited OLLAMA_PROXY_QUEUE_TIMEOUT seconds gets a 503,
+* while the limit is 0 (no routable host) requests get a 503 immediately,
+  and so does everyone already waiting,
+* a request that finds the queue full gets a 429 immediately,
+* a request whose client disconnects while waiting leaves the queue.
+
+Rejections carry Retry-After, estimated from the recent service time
+and the queue ahead (server.py replaces it for no_capacity with the time
+until the first ejected host may come back). Queue depth, in-flight requests, outcomes and wait
+times are exported in the Prometheus text format by render_prometheus().
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+MAX_CONCURRENT = int(os.getenv("OLLAMA_PROXY_MAX_CONCURRENT", "2"))
+MAX_QUEUE = int(os.getenv("OLLAMA_PROXY_MAX_QUEUE", "16"))
+QUEUE_TIMEOUT = float(os.getenv("OLLAMA_PROXY_QUEUE_TIMEOUT", "30"))
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Weight of the newest request in the moving average of service time
+SERVICE_EWMA = 0.2
+# How often a waiting request checks whether its client is still there
+DISCONNECT_POLL = 0.5
+
+OUTCOMES = ("admitted", "queue_full", "queue_timeout", "no_capacity", "cancelled")
+
+
+def handed_over(waiter) -> bool:
+    return waiter.done() and not waiter.cancelled() and waiter.result()
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+        self.sum += seconds
+
+    def render(self, name: str):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {cumulative}")
+        return lines
+
+
+class Slot:
+    """A held concurrency slot. release() is idempotent, so every exit path can call it."""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, max_queue: int = MAX_QUEUE, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = deque()  # futures, oldest first
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.wait_seconds = Histogram()
+        self.service_seconds = Histogram()
+        self.average_service = 1.0
+
+    def retry_after(self) -> int:
+        # Roughly how long until everyone already waiting has been served
+        return max(1, math.ceil(self.average_service * (len(self.waiters) + 1) / max(self.max_concurrent, 1)))
+
+    async def acquire(self, is_disconnected=None) -> Slot:
+        """
+        Wait for a slot, or raise Rejected. is_disconnected (e.g. Request.is_disconnected)
+        lets a waiting request give up its place as soon as the client goes away.
+        """
+        start = time.monotonic()
+        if self.max_concurrent <= 0:
+            # Nothing to wait for until a host comes back
+            self.outcomes["no_capacity"] += 1
+            raise Rejected(503, "no_capacity", self.retry_after())
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.max_queue:
+                self.outcomes["queue_full"] += 1
+                raise Rejected(429, "queue_full", self.retry_after())
+
+            # Resolves to True with a slot, or False when the limit dropped to 0
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            deadline = start + self.queue_timeout
+            try:
+                while not waiter.done():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.forget(waiter)
+                        self.outcomes["queue_timeout"] += 1
+                        self.wait_seconds.observe(time.monotonic() - start)
+                        raise Rejected(503, "queue_timeout", self.retry_after())
+                    await asyncio.wait({waiter}, timeout=min(remaining, DISCONNECT_POLL) if is_disconnected else remaining)
+                    if not waiter.done() and is_disconnected is not None and await is_disconnected():
+                        if handed_over(waiter):
+                            self.release(None)  # the slot was handed over during the check, pass it on
+                        else:
+                            self.forget(waiter)
+                        self.outcomes["cancelled"] += 1
+                        raise Rejected(499, "disconnected", 0)
+            except asyncio.CancelledError:
+                if handed_over(waiter):
+                    self.release(None)  # the slot was handed over just before the cancel
+                else:
+                    self.forget(waiter)
+                self.outcomes["cancelled"] += 1
+                raise
+            if not waiter.result():
+                self.outcomes["no_capacity"] += 1
+                self.wait_seconds.observe(time.monotonic() - start)
+                raise Rejected(503, "no_capacity", self.retry_after())
+
+        self.outcomes["admitted"] += 1
+        self.wait_seconds.observe(time.monotonic() - start)
+        return Slot(self)
+
+    def forget(self, waiter):
+        waiter.cancel()
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def resize(self, max_concurrent: int):
+        """
+        Change the limit, e.g. when backend hosts come and go. Waiters are
+        admitted if it grew, and turned away if it dropped to 0.
+        """
+        self.max_concurrent = max_concurrent
+        if max_concurrent <= 0:
+            while self.waiters:
+                waiter = self.waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(False)
+        while self.active < self.max_concurrent and self.hand_over():
+            self.active += 1
+
+    def hand_over(self) -> bool:
+        # Give a slot to the oldest live waiter
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return True
+        return False
+
+    def release(self, service_seconds: float = None):
+        if service_seconds is not None:
+            self.service_seconds.observe(service_seconds)
+            self.average_service += SERVICE_EWMA * (service_seconds - self.average_service)
+        # Hand the slot straight to the oldest live waiter, so active stays the same,
+        # unless the limit has shrunk below what is in flight
+        if self.active <= self.max_concurrent and self.hand_over():
+            return
+        self.active -= 1
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP ollama_proxy_in_flight Requests currently forwarded to Ollama.",
+            "# TYPE ollama_proxy_in_flight gauge",
+            f"ollama_proxy_in_flight {self.active}",
+            "# HELP ollama_proxy_concurrency_limit Maximum requests forwarded at once.",
+            "# TYPE ollama_proxy_concurrency_limit gauge",
+            f"ollama_proxy_concurrency_limit {self.max_concurrent}",
+            "# HELP ollama_proxy_queue_depth Requests waiting for a slot.",
+            "# TYPE ollama_proxy_queue_depth gauge",
+            f"ollama_proxy_queue_depth {len(self.waiters)}",
+            "# HELP ollama_proxy_queue_capacity Maximum requests waiting for a slot.",
+            "# TYPE ollama_proxy_queue_capacity gauge",
+            f"ollama_proxy_queue_capacity {self.max_queue}",
+            "# HELP ollama_proxy_requests_total Requests by admission outcome.",
+            "# TYPE ollama_proxy_requests_total counter",
+        ]
+        for outcome, count in self.outcomes.items():
+            lines.append(f'ollama_proxy_requests_total{{outcome="{outcome}"}} {count}')
+        lines += [
+            "# HELP ollama_proxy_queue_wait_seconds Time from arrival to admission or rejection by timeout.",
+            "# TYPE ollama_proxy_queue_wait_seconds histogram",
+            *self.wait_seconds.render("ollama_proxy_queue_wait_seconds"),
+            "# HELP ollama_proxy_service_seconds Time a slot was held.",
+            "# TYPE ollama_proxy_service_seconds histogram",
+            *self.service_seconds.render("ollama_proxy_service_seconds"),
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,281 @@
+"""
+A pool of Ollama hosts behind the proxy.
+
+OLLAMA_HOSTS is a comma-separated list of Ollama base URLs (default: the
+single OLLAMA_HOST). Every request goes to the host with the fewest requests
+outstanding from this proxy, with two refinements:
+
+* Hosts that already have the requested model in memory (/api/ps) win over
+  hosts that would have to load it, unless they are busier by more than
+  OLLAMA_PREFER_LOADED_SLACK requests. A cold load of a multi-GB model costs
+  far more than queueing behind one or two generations.
+* Hosts known not to have the model pulled (/api/tags) are skipped.
+* No host gets more than OLLAMA_PROXY_MAX_CONCURRENT requests at once.
+
+capacity() is that limit times the routable hosts. The proxy's admission
+control follows it (on_capacity_change), so it stops admitting work that
+no healthy host could take.
+
+A background task checks every host each OLLAMA_HEALTH_INTERVAL seconds.
+A host that fails OLLAMA_EJECT_AFTER checks or requests in a row is ejected.
+It gets no traffic until a health check succeeds again, at the earliest
+after OLLAMA_EJECT_SECONDS (doubling while it keeps failing).
+
+stub_ollama.py is a fake Ollama for trying this without real models.
+"""
+
+import asyncio
+import os
+import time
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+from admission import MAX_CONCURRENT
+
+OLLAMA_HOSTS = [
+    host.strip()
+    for host in os.getenv("OLLAMA_HOSTS", os.getenv("OLLAMA_HOST", "http://localhost:11434")).split(",")
+    if host.strip()
+]
+HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "5"))
+HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "2"))
+EJECT_AFTER = int(os.getenv("OLLAMA_EJECT_AFTER", "2"))
+EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", "10"))
+MAX_EJECT_SECONDS = 120
+PREFER_LOADED_SLACK = int(os.getenv("OLLAMA_PREFER_LOADED_SLACK", "2"))
+
+# Errors that say something about the host rather than the request
+HOST_ERRORS = (ConnectionError, httpx.TransportError, asyncio.TimeoutError)
+
+
+def is_host_error(error: Exception) -> bool:
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, HOST_ERRORS)
+
+
+def model_names(models):
+    # /api/ps and /api/tags report "gemma:2b"; requests may say "gemma" for "gemma:latest"
+    names = set()
+    for model in models:
+        name = model.model or getattr(model, "name", None)
+        if name:
+            names.add(name)
+            if name.endswith(":latest"):
+                names.add(name[: -len(":latest")])
+    return names
+
+
+class NoHostAvailable(Exception):
+    pass
+
+
+class Host:
+    def __init__(self, url: str):
+        self.url = url
+        # Generations can take minutes, so only health checks get a timeout
+        self.client = AsyncClient(host=url)
+        self.health_client = AsyncClient(host=url, timeout=HEALTH_TIMEOUT)
+        self.outstanding = 0
+        self.healthy = True  # optimistic until the first check
+        self.failures = 0
+        self.eject_seconds = EJECT_SECONDS
+        self.ejected_until = 0.0
+        self.loaded = set()
+        self.available = None  # None = unknown, don't filter on it
+        self.last_check = None
+
+    @property
+    def routable(self) -> bool:
+        return self.healthy and time.monotonic() >= self.ejected_until
+
+    def succeeded(self):
+        self.failures = 0
+        self.healthy = True
+        self.eject_seconds = EJECT_SECONDS
+
+    def failed(self):
+        self.failures += 1
+        now = time.monotonic()
+        if self.failures < EJECT_AFTER or now < self.ejected_until:
+            return
+        if self.healthy:
+            print(f"Ejecting Ollama host {self.url} after {self.failures} failures")
+        else:
+            # Still failing once the ejection ran out: stay out longer next time
+            self.eject_seconds = min(self.eject_seconds * 2, MAX_EJECT_SECONDS)
+        self.healthy = False
+        self.ejected_until = now + self.eject_seconds
+
+    async def check(self):
+        try:
+            running, pulled = await asyncio.gather(self.health_client.ps(), self.health_client.list())
+        except Exception as e:
+            self.failed()
+            self.last_check = {"ok": False, "error": str(e) or type(e).__name__}
+            return
+        if not self.healthy:
+            print(f"Ollama host {self.url} is healthy again")
+        self.loaded = model_names(running.models)
+        self.available = model_names(pulled.models)
+        self.last_check = {"ok": True}
+        # An ejected host comes back once this passes and ejected_until has expired
+        self.succeeded()
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "routable": self.routable,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.failures,
+            "loaded_models": sorted(self.loaded),
+            "last_check": self.last_check,
+        }
+
+
+class Lease:
+    """One request's claim on a host. release() is idempotent, so every exit path can call it."""
+
+    def __init__(self, pool, host: Host, model: str):
+        self.pool = pool
+        self.host = host
+        self.model = model
+        self.released = False
+        host.outstanding += 1
+
+    def release(self, error: Exception = None):
+        if self.released:
+            return
+        self.released = True
+        self.host.outstanding -= 1
+        if error is not None and is_host_error(error):
+            self.host.failed()
+        elif error is None:
+            # A finished generation leaves the model loaded on that host
+            self.host.loaded.add(self.model)
+            self.host.succeeded()
+        self.pool.update_capacity()
+
+
+class OllamaPool:
+    def __init__(self, urls=None, max_per_host: int = MAX_CONCURRENT, on_capacity_change=None):
+        self.hosts = [Host(url) for url in (urls or OLLAMA_HOSTS)]
+        self.max_per_host = max_per_host
+        # Called with the new capacity() whenever hosts are ejected or come back
+        self.on_capacity_change = on_capacity_change
+        self.last_capacity = self.capacity()
+        self.task = None
+
+    def capacity(self) -> int:
+        return self.max_per_host * sum(h.routable for h in self.hosts)
+
+    def update_capacity(self):
+        capacity = self.capacity()
+        if capacity != self.last_capacity:
+            print(f"Ollama pool capacity {self.last_capacity} -> {capacity}")
+            self.last_capacity = capacity
+            if self.on_capacity_change is not None:
+                self.on_capacity_change(capacity)
+
+    def choose(self, model: str, exclude=()) -> Host:
+        candidates = [h for h in self.hosts if h.routable and h not in exclude]
+        candidates = [h for h in candidates if h.available is None or model in h.available] or candidates
+        if not candidates:
+            raise NoHostAvailable(f"no healthy Ollama host for {model}")
+        candidates = [h for h in candidates if h.outstanding < self.max_per_host]
+        if not candidates:
+            raise NoHostAvailable(f"every healthy Ollama host is busy with {self.max_per_host} requests")
+
+        least = min(candidates, key=lambda h: h.outstanding)
+        loaded = [h for h in candidates if model in h.loaded]
+        if loaded:
+            warm = min(loaded, key=lambda h: h.outstanding)
+            if warm.outstanding <= least.outstanding + PREFER_LOADED_SLACK:
+                return warm
+        return least
+
+    def retry_after(self) -> int:
+        """Seconds until the first ejected host may get traffic again."""
+        now = time.monotonic()
+        return max(1, round(min((h.ejected_until - now for h in self.hosts), default=1)))
+
+    def lease(self, model: str, exclude=()) -> Lease:
+        return Lease(self, self.choose(model, exclude), model)
+
+    async def chat(self, model: str, messages):
+        """Non-streaming chat, retried on other hosts if a host fails."""
+        tried = []
+        while True:
+            lease = self.lease(model, tried)
+            try:
+                response = await lease.host.client.chat(model=model, messages=messages)
+            except Exception as e:
+                lease.release(e)
+                if not is_host_error(e) or len(tried) + 1 >= len(self.hosts):
+                    raise
+                tried.append(lease.host)
+                continue
+            lease.release()
+            return response
+
+    async def chat_stream(self, model: str, messages):
+        """
+        (lease, first part, stream) for a streaming chat. Host failures before
+        the first part arrives are retried on another host; the caller must
+        release the lease when the stream ends.
+        """
+        tried = []
+        while True:
+            lease = self.lease(model, tried)
+            stream = None
+            try:
+                stream = await lease.host.client.chat(model=model, messages=messages, stream=True)
+                # The connection is only made on first iteration
+                first = await anext(stream)
+                return lease, first, stream
+            except Exception as e:
+                if stream is not None:
+                    await stream.aclose()
+                lease.release(e)
+                if not is_host_error(e) or len(tried) + 1 >= len(self.hosts):
+                    raise
+                tried.append(lease.host)
+
+    async def check_all(self):
+        await asyncio.gather(*(host.check() for host in self.hosts))
+        # Also picks up hosts whose ejection has run out
+        self.update_capacity()
+
+    async def run_health_checks(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run_health_checks())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self):
+        return [host.stats() for host in self.hosts]
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP ollama_proxy_host_outstanding Requests in flight per Ollama host.",
+            "# TYPE ollama_proxy_host_outstanding gauge",
+        ]
+        lines += [f'ollama_proxy_host_outstanding{{host="{h.url}"}} {h.outstanding}' for h in self.hosts]
+        lines += [
+            "# HELP ollama_proxy_host_routable Whether the host currently gets traffic (1) or is ejected (0).",
+            "# TYPE ollama_proxy_host_routable gauge",
+        ]
+        lines += [f'ollama_proxy_host_routable{{host="{h.url}"}} {int(h.routable)}' for h in self.hosts]
+        return "\n".join(lines) + "\n"
@@ -1,17 +1,72 @@
-from fastapi import FastAPI
+import json
+import os
+from contextlib import asynccontextmanager
+
+import anyio
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from ollama import Client
+from starlette.background import BackgroundTask
+
+from admission import AdmissionController, Rejected
+from pool import NoHostAvailable, OllamaPool
+
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma:2b")
+
+# Ollama hosts from OLLAMA_HOSTS (or the single OLLAMA_HOST), see pool.py
+pool = OllamaPool()
+# Bounds what is forwarded at once (OLLAMA_PROXY_MAX_CONCURRENT per routable host)
+# and how long the rest may wait
+admission = AdmissionController(max_concurrent=pool.capacity())
+pool.on_capacity_change = admission.resize
 
-app = FastAPI()
-client = Client(
-    host="http://localhost:11434",
-)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Periodic health and loaded-model checks of every host
+    pool.start()
+    yield
+    await pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class ChatRequest(BaseModel):
     message: str
 
 
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+REJECTIONS = {
+    "queue_full": "Too many requests queued for the model.",
+    "queue_timeout": "Timed out waiting for the model.",
+    "disconnected": "Client closed the request while it was queued.",
+    "no_capacity": "No healthy Ollama host.",
+}
+
+
+def no_host(error: NoHostAvailable):
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(pool.retry_after())})
+
+
+async def admit(http_request: Request):
+    """
+    Wait for a slot; over capacity this fails fast with 429 (queue full) or 503
+    (waited too long, or no healthy host to wait for).
+    """
+    try:
+        return await admission.acquire(http_request.is_disconnected)
+    except Rejected as e:
+        # With every host ejected, the wait is until the first one may come back
+        retry_after = pool.retry_after() if e.reason == "no_capacity" else e.retry_after
+        raise HTTPException(
+            status_code=e.status_code, detail=REJECTIONS[e.reason], headers={"Retry-After": str(retry_after)}
+        )
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
@@ -25,9 +80,109 @@ def read_contact():  # Changed function name to avoid duplicate
 
 
 @app.post("/chat")
-def chat(request: ChatRequest):
-    response = client.chat(
-        model="gemma:2b", messages=[{"role": "user", "content": request.message}]
-    )
+async def chat(request: ChatRequest, http_request: Request):
+    slot = await admit(http_request)
+    try:
+        response = await pool.chat(
+            model=OLLAMA_MODEL, messages=[{"role": "user", "content": request.message}]
+        )
+    except NoHostAvailable as e:
+        raise no_host(e)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Ollama error: {e}")
+    finally:
+        slot.release()
 
     return {"response": response.message.content}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Same as /chat, but tokens are sent as Server-Sent Events while the model
+    generates them:
+
+        event: token   data: {"content": "..."}    one per chunk from Ollama
+        event: done    data: {"eval_count": ..., "total_duration": ...}
+        event: error   data: {"error": "..."}
+
+    When the client goes away the request to Ollama is closed, which makes
+    Ollama stop generating instead of finishing an answer nobody reads.
+
+    Admission happens before the stream starts, so a full queue is a plain
+    429/503 response rather than an error event. The slot is held until the
+    stream ends.
+
+    The host is picked, and failed hosts retried, before the response starts,
+    so the client only sees hosts that produced a first chunk.
+    """
+    slot = await admit(http_request)
+    try:
+        lease, first, stream = await pool.chat_stream(
+            model=OLLAMA_MODEL,
+            messages=[{"role": "user", "content": request.message}],
+        )
+    except NoHostAvailable as e:
+        slot.release()
+        raise no_host(e)
+    except Exception as e:
+        slot.release()
+        raise HTTPException(status_code=502, detail=f"Ollama error: {e}")
+
+    async def parts():
+        yield first
+        async for part in stream:
+            yield part
+
+    async def close(error: Exception = None):
+        # Closing the HTTP response to Ollama cancels the generation there.
+        # Under uvicorn Starlette cancels the body as soon as the client
+        # disconnects, so the close has to be shielded. Safe to run twice.
+        with anyio.CancelScope(shield=True):
+            await stream.aclose()
+        lease.release(error)
+        slot.release()
+
+    async def events():
+        error = None
+        try:
+            async for part in parts():
+                # Servers that don't cancel the response on disconnect (ASGI
+                # spec 2.4+) only notice it here, before the next chunk
+                if await http_request.is_disconnected():
+                    break
+                if part.message.content:
+                    yield sse("token", {"content": part.message.content})
+                if part.done:
+                    yield sse("done", {
+                        "done_reason": part.done_reason,
+                        "prompt_eval_count": part.prompt_eval_count,
+                        "eval_count": part.eval_count,
+                        "total_duration": part.total_duration,
+                    })
+        except Exception as e:
+            error = e
+            yield sse("error", {"error": str(e)})
+        finally:
+            await close(error)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs when the client disconnects before the body is iterated,
+        # when the finally above never runs
+        background=BackgroundTask(close),
+    )
+
+
+@app.get("/pool")
+async def get_pool():
+    """Health, load and loaded models of every Ollama host."""
+    return pool.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """In-flight requests, queue depth, admission outcomes, queue wait times and per-host load."""
+    return admission.render_prometheus() + pool.render_prometheus()
@@ -0,0 +1,109 @@
+"""
+A fake Ollama for trying the proxy and its host pool without GPUs or models.
+
+    uvicorn stub_ollama:app --port 11501   # or:
+    python stub_ollama.py --port 11501 --models gemma:2b --loaded gemma:2b
+
+/api/chat answers with WORDS words, one every --delay seconds (streamed or
+not). A model that is not loaded yet costs --load-delay seconds on its first
+request, like a cold load in Ollama. /api/ps and /api/tags report the loaded
+and pulled models, which is what the pool's health check reads.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+MODELS = os.getenv("STUB_OLLAMA_MODELS", "gemma:2b").split(",")
+LOADED = set(filter(None, os.getenv("STUB_OLLAMA_LOADED", "").split(",")))
+DELAY = float(os.getenv("STUB_OLLAMA_DELAY", "0.05"))
+LOAD_DELAY = float(os.getenv("STUB_OLLAMA_LOAD_DELAY", "2"))
+WORDS = 20
+
+CREATED_AT = "2024-01-01T00:00:00Z"
+
+
+def model_info(name: str):
+    return {"name": name, "model": name, "size": 0, "digest": "", "details": {}}
+
+
+def message(model: str, content: str, done: bool = False, **extra):
+    return {
+        "model": model,
+        "created_at": CREATED_AT,
+        "message": {"role": "assistant", "content": content},
+        "done": done,
+        **extra,
+    }
+
+
+async def chat(request):
+    body = await request.json()
+    model = body["model"]
+    if model not in MODELS:
+        return JSONResponse({"error": f"model '{model}' not found"}, status_code=404)
+
+    start = time.perf_counter()
+    if model not in LOADED:
+        await asyncio.sleep(LOAD_DELAY)
+        LOADED.add(model)
+
+    def done():
+        return message(model, "", done=True, done_reason="stop", prompt_eval_count=3, eval_count=WORDS,
+                       total_duration=int((time.perf_counter() - start) * 1e9))
+
+    if not body.get("stream", True):
+        await asyncio.sleep(DELAY * WORDS)
+        return JSONResponse({**done(), "message": {"role": "assistant", "content": " ".join(f"w{i}" for i in range(WORDS))}})
+
+    async def lines():
+        for i in range(WORDS):
+            yield json.dumps(message(model, f"w{i} ")) + "\n"
+            await asyncio.sleep(DELAY)
+        yield json.dumps(done()) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def ps(request):
+    return JSONResponse({"models": [model_info(name) for name in sorted(LOADED)]})
+
+
+async def tags(request):
+    return JSONResponse({"models": [model_info(name) for name in MODELS]})
+
+
+async def version(request):
+    return JSONResponse({"version": "0.0.0-stub"})
+
+
+app = Starlette(routes=[
+    Route("/api/chat", chat, methods=["POST"]),
+    Route("/api/ps", ps),
+    Route("/api/tags", tags),
+    Route("/api/version", version),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--models", default=",".join(MODELS), help="comma-separated pulled models")
+    parser.add_argument("--loaded", default=",".join(sorted(LOADED)), help="comma-separated models already in memory")
+    parser.add_argument("--delay", type=float, default=DELAY, help="seconds per generated word")
+    parser.add_argument("--load-delay", type=float, default=LOAD_DELAY, help="seconds to load a model")
+    args = parser.parse_args()
+
+    MODELS = args.models.split(",")
+    LOADED = set(filter(None, args.loaded.split(",")))
+    DELAY = args.delay
+    LOAD_DELAY = args.load_delay
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -8,7 +8,9 @@ Handles dimension mismatch by manually creating collection with correct dimensio
 
 import json
 import os
+import sys
 import time
+from pathlib import Path
 from dotenv import load_dotenv
 
 # mem0
@@ -34,6 +36,8 @@ GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "mem_agent_collection_gemini")
 USER_ID = os.getenv("MEM_USER_ID", "akhil")
+# "local" keeps memories in rag/local_store.py's in-process index instead of Qdrant
+MEM_VECTOR_STORE = os.getenv("MEM_VECTOR_STORE", "qdrant")
 
 # Gemini text-embedding-004 produces 768-dimensional vectors
 EMBEDDING_DIMENSION = 768
@@ -70,6 +74,19 @@ config = {
     },
 }
 
+if MEM_VECTOR_STORE == "local":
+    sys.path.append(str(Path(__file__).resolve().parents[1] / "rag"))
+    from local_store import LocalVectorStore
+
+    # mem0's "langchain" provider accepts any LangChain VectorStore
+    config["vector_store"] = {
+        "provider": "langchain",
+        "config": {
+            "client": LocalVectorStore.open(QDRANT_COLLECTION, dimension=EMBEDDING_DIMENSION),
+            "collection_name": QDRANT_COLLECTION,
+        },
+    }
+
 
 def ensure_collection_with_correct_dimensions():
     """
@@ -157,12 +174,13 @@ def create_mem_client():
 
 def run_chat_loop():
     # Ensure collection is properly set up before starting
-    print("\n=== Initializing Qdrant collection ===")
-    try:
-        ensure_collection_with_correct_dimensions()
-    except Exception as e:
-        print(f"[error] Failed to initialize Qdrant: {e}")
-        return
+    if MEM_VECTOR_STORE != "local":
+        print("\n=== Initializing Qdrant collection ===")
+        try:
+            ensure_collection_with_correct_dimensions()
+        except Exception as e:
+            print(f"[error] Failed to initialize Qdrant: {e}")
+            return
 
     # Now create mem0 client - it should use the existing collection
     mem_client = create_mem_client()
@@ -0,0 +1,20 @@
+"""Helpers shared by the benchmark scripts (bench_*.py)."""
+
+import re
+
+# Dotted API names (fs.createReadStream, process.nextTick) become benchmark questions
+API_RE = re.compile(r"\b[a-z][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)+")
+# Dotted tokens that are file names or abbreviations, not APIs
+NOT_API = re.compile(r"\.(js|mjs|cjs|json|md|html|txt|org|com|io)$|^(e\.g|i\.e|www)\b")
+
+TEMPLATES = (
+    "How do I use {api}?",
+    "What does {api} do?",
+    "When should I call {api}?",
+    "Explain {api} with an example",
+)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
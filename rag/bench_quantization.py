@@ -0,0 +1,153 @@
+"""
+Memory, latency and recall of float32 vs int8 vs binary vector search.
+
+For each mode the vectors go into a temporary LocalVectorStore (and, with
+--qdrant, a temporary Qdrant collection), and every query is answered with
+the two-step search from quantization.py: quantized shortlist of
+k * oversampling rows, float32 rescoring. recall@k is measured against the
+exact float32 top k, so it isolates what quantization loses; it says
+nothing about whether those chunks answer the question.
+
+Vectors come from the local collection (--source local, needs
+`python index.py --backend local`) or from a synthetic clustered set that
+needs nothing at all. Queries are stored vectors with a little noise added.
+
+    python bench_quantization.py [--source synthetic|local] [--points 20000] [--k 4]
+                                 [--oversampling 1 2 3] [--qdrant]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from bench_common import percentile
+from local_store import LocalVectorStore, normalize, top_k
+from quantization import code_bytes, qdrant_quantization_config, qdrant_search_params
+
+COLLECTION_NAME = "learning_rag_gemini"
+BENCH_COLLECTION = "bench_quantization"
+
+
+def synthetic_vectors(points: int, dimension: int, seed: int):
+    # Clustered like real embeddings, unlike uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, points // 100), dimension))
+    labels = rng.integers(len(centers), size=points)
+    return normalize(centers[labels] + 0.6 * rng.normal(size=(points, dimension)))
+
+
+def local_vectors():
+    store = LocalVectorStore.open(COLLECTION_NAME)
+    live = np.flatnonzero(store.alive[:store.count])
+    return np.array(store.vectors[live])
+
+
+def make_queries(vectors, count: int, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.choice(len(vectors), count, replace=False)]
+    return normalize(picked + 0.05 * rng.normal(size=picked.shape))
+
+
+def report(name, ram_bytes, latencies, found, exact, k):
+    recall = statistics.mean(len(set(f) & set(e)) / k for f, e in zip(found, exact))
+    print(
+        f"{name:>20}: RAM {ram_bytes / 2**20:8.2f} MiB  recall@{k} {recall:.4f}  "
+        f"p50 {statistics.median(latencies):6.2f} ms  p95 {percentile(latencies, 95):6.2f} ms"
+    )
+
+
+def bench_local(vectors, queries, exact, kinds, oversamplings, k):
+    ids = [str(i) for i in range(len(vectors))]
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(path, dimension=vectors.shape[1], collection_name=BENCH_COLLECTION)
+        store.add_embeddings(vectors, ids=ids, texts=[""] * len(ids))
+
+        for kind in kinds:
+            store.build_quantized(kind)
+            for oversampling in (oversamplings if kind != "none" else [0]):
+                latencies, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    docs = store.similarity_search_by_vector(query, k=k, nprobe=0, oversampling=oversampling)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found.append([int(doc.metadata["_id"]) for doc in docs])
+                name = f"local {kind}" + (f" x{oversampling:g}" if kind != "none" else "")
+                report(name, code_bytes(len(vectors), vectors.shape[1], kind), latencies, found, exact, k)
+
+
+def bench_qdrant(vectors, queries, exact, kinds, oversamplings, k):
+    from dotenv import load_dotenv
+    from qdrant_client import QdrantClient, models
+
+    load_dotenv()
+    client = QdrantClient(url=os.getenv("QDRANT_URL"))
+    for kind in kinds:
+        name = f"{BENCH_COLLECTION}_{kind}"
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        client.create_collection(
+            collection_name=name,
+            vectors_config=models.VectorParams(
+                size=vectors.shape[1], distance=models.Distance.COSINE, on_disk=kind != "none"
+            ),
+            quantization_config=qdrant_quantization_config(kind),
+        )
+        try:
+            for start in range(0, len(vectors), 1000):
+                client.upsert(
+                    collection_name=name,
+                    points=models.Batch(
+                        ids=list(range(start, min(start + 1000, len(vectors)))),
+                        vectors=vectors[start:start + 1000].tolist(),
+                    ),
+                )
+            # Quantized segments are built by the optimizer in the background
+            while client.get_collection(name).status != models.CollectionStatus.GREEN:
+                time.sleep(0.5)
+
+            for oversampling in (oversamplings if kind != "none" else [0]):
+                params = qdrant_search_params(kind, oversampling) if kind != "none" else None
+                latencies, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    response = client.query_points(name, query=query.tolist(), limit=k, search_params=params)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found.append([point.id for point in response.points])
+                label = f"qdrant {kind}" + (f" x{oversampling:g}" if kind != "none" else "")
+                report(label, code_bytes(len(vectors), vectors.shape[1], kind), latencies, found, exact, k)
+        finally:
+            client.delete_collection(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["synthetic", "local"], default="synthetic")
+    parser.add_argument("--points", type=int, default=20000, help="synthetic vectors")
+    parser.add_argument("--dimension", type=int, default=768, help="synthetic dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1.0, 2.0, 3.0, 5.0])
+    parser.add_argument("--kinds", nargs="+", choices=["none", "int8", "binary"], default=["none", "int8", "binary"])
+    parser.add_argument("--qdrant", action="store_true", help="also benchmark temporary collections at QDRANT_URL")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = local_vectors() if args.source == "local" else synthetic_vectors(args.points, args.dimension, args.seed)
+    if len(vectors) < args.queries:
+        parser.error(f"only {len(vectors)} vectors, fewer than --queries")
+    queries = make_queries(vectors, args.queries, args.seed)
+    exact = [top_k(vectors @ query, args.k).tolist() for query in queries]
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]} ({args.source}), {len(queries)} queries")
+    print("RAM is what the first pass keeps in memory; the float32 vectors used for rescoring stay on disk")
+
+    bench_local(vectors, queries, exact, args.kinds, args.oversampling, args.k)
+    if args.qdrant:
+        bench_qdrant(vectors, queries, exact, args.kinds, args.oversampling, args.k)
+
+
+if __name__ == "__main__":
+    main()
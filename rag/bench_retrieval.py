@@ -0,0 +1,114 @@
+"""
+Retrieval quality and latency, vector-only vs hybrid (vector + BM25, RRF).
+
+Builds an evaluation set from the indexed corpus itself: dotted API names
+(`fs.createReadStream`, `process.nextTick`, ...) that occur in only a few
+chunks become questions like "How do I use fs.createReadStream?", and the
+chunks mentioning the name are the relevant ones. That targets exactly the
+exact-name failure mode of dense retrieval and says little about
+paraphrased questions. Needs a finished
+`python index.py` run (vector collection plus lexical index) and the usual
+.env; query embeddings go through the embedding cache, so re-runs are free.
+
+    python bench_retrieval.py [--queries 200] [--k 4] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from dotenv import load_dotenv
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_qdrant import QdrantVectorStore
+
+from bench_common import API_RE, NOT_API, TEMPLATES, percentile
+from embedding_cache import CachedEmbeddings
+from lexical import LexicalIndex, hybrid_search
+from local_store import VECTOR_BACKEND, LocalVectorStore
+
+COLLECTION_NAME = "learning_rag_gemini"
+
+# A name mentioned in more chunks than this is too generic to make a useful question
+MAX_RELEVANT = 5
+
+
+def build_queries(lexical_index, count: int, seed: int):
+    mentions = {}
+    for row, text in enumerate(lexical_index.texts):
+        for api in set(API_RE.findall(text)):
+            # Very long "names" are tokens and hashes pasted into the docs
+            if 6 <= len(api) <= 40 and not NOT_API.search(api):
+                mentions.setdefault(api, set()).add(lexical_index.ids[row])
+
+    apis = sorted(api for api, ids in mentions.items() if len(ids) <= MAX_RELEVANT)
+    rng = random.Random(seed)
+    rng.shuffle(apis)
+    return [(rng.choice(TEMPLATES).format(api=api), mentions[api]) for api in apis[:count]]
+
+
+def score(results, relevant, k):
+    ids = [doc.metadata.get("_id") for doc in results[:k]]
+    found = [i for i in ids if i in relevant]
+    first = next((rank for rank, i in enumerate(ids, start=1) if i in relevant), None)
+    return {
+        "hit": 1.0 if found else 0.0,
+        "recall": len(found) / min(len(relevant), k),
+        "rr": 1.0 / first if first else 0.0,
+    }
+
+
+def run(name, search, queries, vectors, k):
+    # One untimed call so connection setup doesn't land in the first sample
+    search(queries[0][0], vectors[0])
+    scores, latencies = [], []
+    for (query, relevant), vector in zip(queries, vectors):
+        start = time.perf_counter()
+        results = search(query, vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        scores.append(score(results, relevant, k))
+
+    print(
+        f"{name:>8}: hit@{k} {statistics.mean(s['hit'] for s in scores):.3f}  "
+        f"recall@{k} {statistics.mean(s['recall'] for s in scores):.3f}  "
+        f"MRR {statistics.mean(s['rr'] for s in scores):.3f}  "
+        f"p50 {statistics.median(latencies):6.2f} ms  p95 {percentile(latencies, 95):6.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv()
+    os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
+    embedding_model = CachedEmbeddings(GoogleGenerativeAIEmbeddings(model="models/text-embedding-004"))
+
+    lexical_index = LexicalIndex.load(COLLECTION_NAME)
+    if lexical_index is None:
+        parser.error("no lexical index, run index.py first")
+    if VECTOR_BACKEND == "local":
+        vector_store = LocalVectorStore.open(COLLECTION_NAME, embedding_model)
+    else:
+        vector_store = QdrantVectorStore.from_existing_collection(
+            url=os.getenv("QDRANT_URL"),
+            collection_name=COLLECTION_NAME,
+            embedding=embedding_model,
+        )
+
+    queries = build_queries(lexical_index, args.queries, args.seed)
+    if not queries:
+        parser.error("no API names found in the corpus")
+    vectors = embedding_model.embed_documents([q for q, _ in queries], task_type="RETRIEVAL_QUERY")
+    print(f"{len(queries)} API-name questions over {len(lexical_index)} chunks ({VECTOR_BACKEND} backend)")
+
+    run("vector", lambda q, v: vector_store.similarity_search_by_vector(v, k=args.k), queries, vectors, args.k)
+    run("hybrid", lambda q, v: hybrid_search(vector_store, lexical_index, q, v, k=args.k), queries, vectors, args.k)
+
+
+if __name__ == "__main__":
+    main()
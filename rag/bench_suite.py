@@ -0,0 +1,271 @@
+"""
+Offline retrieval benchmark: chunking parameters x retrieval strategy x k.
+
+Runs without network access or API keys, so it can run in CI. Gemini
+embeddings are replaced by a deterministic stand-in (HashingEmbeddings:
+feature-hashed words and character trigrams). Its absolute scores say nothing
+about text-embedding-004, but comparing chunkings and strategies with it
+still tells you something, and the numbers are identical from run to run.
+
+For every (chunk_size, chunk_overlap) the PDFs are split the way index.py
+splits them, embedded into a temporary LocalVectorStore and a temporary
+BM25 index, and every question is answered by each strategy:
+
+* vector         exact float32 search
+* vector-int8    int8 first pass with float32 rescoring (quantization.py)
+* vector-binary  binary first pass with float32 rescoring (the stand-in
+                 vectors are sparse, so sign bits keep little of them; expect
+                 this to do far worse here than with real embeddings)
+* lexical        BM25 only
+* hybrid         vector + BM25 fused with RRF (lexical.py)
+* hybrid-rerank  hybrid candidates reordered by the lexical reranker (rerank.py)
+
+Relevance is judged per page, so results from different chunkings can be
+compared: a retrieved chunk is a hit if it comes from a page labeled
+relevant for the question. The question set is a JSONL file of
+{"question": ..., "pages": [{"source": "nodejs.pdf", "page": 12}, ...]}
+(page numbers are 0-based, as in PyPDFLoader metadata). Without --questions, one is
+generated from the corpus: rare dotted API names become "How do I use
+fs.createReadStream?" with every page that mentions the name as relevant.
+Questions built this way favour lexical matching, so label real
+questions for a fair comparison of dense retrieval.
+
+Reported per configuration: recall@k and MRR for every k, index size on
+disk, index build time, and query latency p50/p99 (search only, at the
+largest k).
+
+    python bench_suite.py
+    python bench_suite.py --chunk-sizes 500 1000 1500 --overlaps 0 200 400 --ks 1 4 8
+    python bench_suite.py --questions questions.jsonl --json results.json
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from bench_common import API_RE, NOT_API, TEMPLATES, percentile
+from lexical import CANDIDATES, LexicalIndex, LexicalIndexWriter, fuse, tokenize
+from local_store import LocalVectorStore, normalize
+from rerank import RERANK_CANDIDATES, LexicalOverlapScorer, Reranker, ScoreCache
+
+default_pdf = Path(__file__).parent / "nodejs.pdf"
+
+STRATEGIES = ("vector", "vector-int8", "vector-binary", "lexical", "hybrid", "hybrid-rerank")
+BENCH_COLLECTION = "bench_suite"
+
+# Same question generation rules as bench_retrieval.py (see bench_common.py)
+MAX_RELEVANT_PAGES = 3
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic offline embedder: signed feature hashing of words and character trigrams."""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _features(self, text: str):
+        words = tokenize(text)
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def _embed(self, text: str):
+        counts = {}
+        for feature in self._features(text):
+            counts[feature] = counts.get(feature, 0) + 1
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, count in counts.items():
+            # blake2b rather than hash(), which is randomized per process
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += sign * (1 + np.log(count))
+        return normalize(vector).tolist()
+
+    def embed_documents(self, texts, **kwargs):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text, **kwargs):
+        return self._embed(text)
+
+
+def page_key(metadata: dict):
+    return (Path(metadata.get("source", "")).name, int(metadata.get("page", 0)))
+
+
+def load_pages(paths):
+    pages = []
+    for path in paths:
+        pages.extend(PyPDFLoader(file_path=str(path)).lazy_load())
+    return pages
+
+
+def generate_questions(pages, count: int, seed: int):
+    mentions = {}
+    for page in pages:
+        for api in set(API_RE.findall(page.page_content)):
+            if 6 <= len(api) <= 40 and not NOT_API.search(api):
+                mentions.setdefault(api, set()).add(page_key(page.metadata))
+
+    apis = sorted(api for api, keys in mentions.items() if len(keys) <= MAX_RELEVANT_PAGES)
+    rng = random.Random(seed)
+    rng.shuffle(apis)
+    return [(rng.choice(TEMPLATES).format(api=api), mentions[api]) for api in apis[:count]]
+
+
+def load_questions(path):
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                questions.append((item["question"], {page_key(p) for p in item["pages"]}))
+    return questions
+
+
+def directory_bytes(path: Path):
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def build(pages, chunk_size: int, chunk_overlap: int, embedding_model, workdir: Path):
+    """Split, embed and index the pages; returns (vector store, lexical index, chunks, seconds)."""
+    start = time.perf_counter()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(pages)
+    ids = [str(i) for i in range(len(chunks))]
+
+    store = LocalVectorStore(workdir / "vectors", dimension=embedding_model.dimension, collection_name=BENCH_COLLECTION)
+    store.add_embeddings(
+        embedding_model.embed_documents([c.page_content for c in chunks]),
+        [c.metadata for c in chunks],
+        ids,
+        [c.page_content for c in chunks],
+    )
+    store.vectors.flush()
+
+    writer = LexicalIndexWriter(BENCH_COLLECTION)
+    for id, chunk in zip(ids, chunks):
+        writer.add(id, chunk.page_content, chunk.metadata)
+    lexical_index = LexicalIndex(writer.finish(workdir / "lexical.npz"), BENCH_COLLECTION)
+    return store, lexical_index, chunks, time.perf_counter() - start
+
+
+def searcher(strategy: str, store, lexical_index, k: int):
+    if strategy == "hybrid-rerank":
+        # Throwaway score cache next to the index, so every run really scores
+        reranker = Reranker(LexicalOverlapScorer(lexical_index), ScoreCache(str(store.path.parent / "rerank.sqlite")), k)
+        hybrid = searcher("hybrid", store, lexical_index, max(k, RERANK_CANDIDATES))
+        return lambda query, vector: reranker.rerank(query, hybrid(query, vector))
+    if strategy == "lexical":
+        return lambda query, vector: [doc for doc, _ in lexical_index.search(query, k)]
+    if strategy == "hybrid":
+        return lambda query, vector: fuse(query, store.similarity_search_by_vector(vector, k=max(k, CANDIDATES)), lexical_index, k)
+    return lambda query, vector: store.similarity_search_by_vector(vector, k=k)
+
+
+def evaluate(results, relevant, ks):
+    """recall@k and reciprocal rank of one ranked result list, page-level."""
+    pages = [page_key(doc.metadata) for doc in results]
+    first = next((rank for rank, page in enumerate(pages, start=1) if page in relevant), None)
+    scores = {"rr": 1.0 / first if first else 0.0}
+    for k in ks:
+        scores[f"recall@{k}"] = len(set(pages[:k]) & relevant) / min(len(relevant), k)
+    return scores
+
+
+def run_strategy(strategy, store, lexical_index, questions, vectors, ks):
+    kind = strategy.split("-")[1] if strategy.startswith("vector-") else "none"
+    if strategy != "lexical":
+        store.build_quantized(kind)
+    search = searcher(strategy, store, lexical_index, max(ks))
+
+    scores, latencies = [], []
+    for (question, relevant), vector in zip(questions, vectors):
+        start = time.perf_counter()
+        results = search(question, vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        scores.append(evaluate(results, relevant, ks))
+
+    row = {name: statistics.mean(s[name] for s in scores) for name in scores[0]}
+    row["mrr"] = row.pop("rr")
+    row["p50_ms"] = statistics.median(latencies)
+    row["p99_ms"] = percentile(latencies, 99)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[str(default_pdf)], help="PDF files")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000, 1500])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 200, 400])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument("--questions", help="labeled JSONL question set (default: generated from the corpus)")
+    parser.add_argument("--max-questions", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384, help="stand-in embedding dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write all results to this file")
+    args = parser.parse_args()
+
+    pages = load_pages(args.paths)
+    questions = load_questions(args.questions) if args.questions else generate_questions(pages, args.max_questions, args.seed)
+    if not questions:
+        parser.error("no questions")
+    embedding_model = HashingEmbeddings(args.dimension)
+    vectors = embedding_model.embed_documents([q for q, _ in questions])
+    ks = sorted(set(args.ks))
+    print(f"{len(pages)} pages, {len(questions)} questions, stand-in embeddings of dimension {args.dimension}")
+
+    header = (
+        f"{'size':>5} {'overlap':>7} {'chunks':>6} {'index MB':>8} {'build s':>7} {'strategy':>13} "
+        + " ".join(f"{f'R@{k}':>6}" for k in ks)
+        + f" {'MRR':>6} {'p50 ms':>7} {'p99 ms':>7}"
+    )
+    print(header)
+
+    results = []
+    for chunk_size in args.chunk_sizes:
+        for chunk_overlap in args.overlaps:
+            if chunk_overlap >= chunk_size:
+                continue
+            with tempfile.TemporaryDirectory() as workdir:
+                workdir = Path(workdir)
+                store, lexical_index, chunks, build_seconds = build(pages, chunk_size, chunk_overlap, embedding_model, workdir)
+                # vectors.f32 is allocated by doubling, so count the rows actually used
+                index_bytes = directory_bytes(workdir) - (store.path / "vectors.f32").stat().st_size + store.count * store.dimension * 4
+
+                for strategy in args.strategies:
+                    row = run_strategy(strategy, store, lexical_index, questions, vectors, ks)
+                    row.update({
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": chunk_overlap,
+                        "strategy": strategy,
+                        "chunks": len(chunks),
+                        "index_bytes": index_bytes,
+                        "build_seconds": build_seconds,
+                    })
+                    results.append(row)
+                    print(
+                        f"{chunk_size:>5} {chunk_overlap:>7} {len(chunks):>6} {index_bytes / 2**20:>8.2f} "
+                        f"{build_seconds:>7.2f} {strategy:>13} "
+                        + " ".join(f"{row[f'recall@{k}']:>6.3f}" for k in ks)
+                        + f" {row['mrr']:>6.3f} {row['p50_ms']:>7.2f} {row['p99_ms']:>7.2f}"
+                    )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
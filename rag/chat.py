@@ -1,28 +1,61 @@
+"""
+Ask questions about the indexed PDF.
+
+    python chat.py                  # interactive session, one question per line
+    python chat.py "What is npm?"   # answer one question and exit
+    echo "What is npm?" | python chat.py
+
+The session builds the embedding model, vector store, BM25 index and LLM
+client once and warms their HTTP connections in the background while the
+first question is typed, so later questions only wait for the embedding
+and LLM calls. The embedding request runs concurrently with the BM25 search
+and the reranking of its candidates. Each answer is followed by the time
+spent in every stage.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_qdrant import QdrantVectorStore
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import sys
+import threading
+import time
+
+from context_packing import get_encoding, pack_context
+from embedding_cache import CachedEmbeddings
+from lexical import CANDIDATES, HYBRID, LexicalIndex, reciprocal_rank_fusion
+from local_store import VECTOR_BACKEND, LocalVectorStore
+from quantization import qdrant_search_params
+from rerank import make_reranker, retrieve_k
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 
+# Chunks that go into the prompt (before reranking trims them further)
+SEARCH_K = 4
+
 # Set API key for Gemini embeddings
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 
-# Embedding model
-embedding_model = GoogleGenerativeAIEmbeddings(
+# Embedding model, behind the on-disk cache shared with index.py and the worker
+embedding_model = CachedEmbeddings(GoogleGenerativeAIEmbeddings(
     model="models/text-embedding-004"
-)
+))
 
-# Load existing Qdrant vector collection
-vector_store = QdrantVectorStore.from_existing_collection(
-    url=QDRANT_URL,
-    collection_name="learning_rag_gemini",
-    embedding=embedding_model,
-)
+if VECTOR_BACKEND == "local":
+    # In-process index built with `python index.py --backend local`
+    vector_store = LocalVectorStore.open("learning_rag_gemini", embedding_model)
+else:
+    # Load existing Qdrant vector collection
+    vector_store = QdrantVectorStore.from_existing_collection(
+        url=QDRANT_URL,
+        collection_name="learning_rag_gemini",
+        embedding=embedding_model,
+    )
 
 # Gemini OpenAI-Compatible Client
 client = OpenAI(
@@ -30,20 +63,74 @@ client = OpenAI(
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
 )
 
-# Take user input
-user_query = input("Ask something: ")
+# Oversampling and float32 rescoring when the collection is quantized (RAG_QUANTIZATION);
+# the local store reads the same settings itself
+search_params = qdrant_search_params()
+
+# Vector and BM25 results are fused, unless RAG_HYBRID=0
+lexical_index = LexicalIndex.load("learning_rag_gemini")
+# With reranking (RAG_RERANK) more candidates are fetched and only the best are kept
+reranker = make_reranker(lexical_index)
+if not HYBRID:
+    lexical_index = None
+
+# Runs the embedding request while the main thread searches BM25
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+def warm_up():
+    """Open the HTTP connections and load lazy resources before the first question needs them."""
+    try:
+        # Straight to the API, past the embedding cache, so the connection really opens
+        embedding_model.embeddings.embed_query("warm up")
+        client.models.list()
+        get_encoding()
+    except Exception as e:
+        print(f"(warm-up failed: {e})", file=sys.stderr)
+
+
+def retrieve(user_query: str, timings: dict):
+    start = time.perf_counter()
+    embedding = executor.submit(embedding_model.embed_query, user_query)
+
+    sparse = []
+    if lexical_index is not None:
+        sparse = [doc for doc, _ in lexical_index.search(user_query, CANDIDATES)]
+        if reranker is not None:
+            # Score the BM25 candidates now; the final rerank finds them in the score cache
+            reranker.rerank(user_query, sparse)
+        timings["bm25"] = time.perf_counter() - start
 
-# Search relevant chunks
-search_results = vector_store.similarity_search(query=user_query)
+    query_embedding = embedding.result()
+    timings["embed"] = time.perf_counter() - start
 
-context = "\n\n\n".join([
-    f"Page Content: {r.page_content}\n"
-    f"Page Number: {r.metadata.get('page_label')}\n"
-    f"File Location: {r.metadata.get('source')}"
-    for r in search_results
-])
+    start = time.perf_counter()
+    k = retrieve_k(SEARCH_K)
+    dense = vector_store.similarity_search_by_vector(
+        query_embedding, k=max(k, CANDIDATES) if lexical_index is not None else k, search_params=search_params
+    )
+    search_results = reciprocal_rank_fusion([dense, sparse], k) if lexical_index is not None else dense
+    timings["search"] = time.perf_counter() - start
 
-SYSTEM_PROMPT = f"""
+    if reranker is not None:
+        start = time.perf_counter()
+        search_results = reranker.rerank(user_query, search_results)
+        timings["rerank"] = time.perf_counter() - start
+    return search_results
+
+
+def build_messages(user_query: str, search_results):
+    # Merge overlapping chunks, drop near-duplicates and fit the rest into the token budget
+    search_results = pack_context(search_results)
+
+    context = "\n\n\n".join([
+        f"Page Content: {r.page_content}\n"
+        f"Page Number: {r.metadata.get('page_label')}\n"
+        f"File Location: {r.metadata.get('source')}"
+        for r in search_results
+    ])
+
+    SYSTEM_PROMPT = f"""
 You are a helpful AI Assistant who answers user queries based ONLY on the context retrieved from the PDF.
 
 Always cite the page number.
@@ -52,12 +139,67 @@ Context:
 {context}
 """
 
-response = client.chat.completions.create(
-    model="gemini-2.5-flash",
-    messages=[
+    return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": user_query},
-    ],
-)
+    ]
+
+
+def answer(user_query: str):
+    timings = {}
+    total = time.perf_counter()
+
+    search_results = retrieve(user_query, timings)
+
+    start = time.perf_counter()
+    messages = build_messages(user_query, search_results)
+    timings["prompt"] = time.perf_counter() - start
+
+    # Streamed, so the answer starts printing with the first token
+    start = time.perf_counter()
+    stream = client.chat.completions.create(
+        model="gemini-2.5-flash",
+        messages=messages,
+        stream=True,
+    )
+    print("\n🤖:", end=" ", flush=True)
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            timings.setdefault("first_token", time.perf_counter() - start)
+            print(delta, end="", flush=True)
+    timings["llm"] = time.perf_counter() - start
+    timings["total"] = time.perf_counter() - total
+
+    print("\n")
+    print("⏱  " + "  ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in timings.items()), "\n")
+
+
+def main():
+    if len(sys.argv) > 1:
+        answer(" ".join(sys.argv[1:]))
+        return
+
+    threading.Thread(target=warm_up, daemon=True).start()
+    interactive = sys.stdin.isatty()
+    while True:
+        try:
+            # Take user input
+            user_query = input("Ask something: " if interactive else "").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if user_query in ("exit", "quit"):
+            break
+        if user_query:
+            try:
+                answer(user_query)
+            except KeyboardInterrupt:
+                # Ctrl-C stops the current answer, not the session
+                print("\n(interrupted)\n")
+            except Exception as e:
+                print(f"\nError: {e}\n")
+
 
-print("\n🤖:", response.choices[0].message.content, "\n")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Context assembly for the RAG prompt.
+
+index.py splits with chunk_overlap=400, so the top-k hits for a query often
+repeat a large part of each other's text. Before the chunks go into the
+system prompt we:
+
+1. merge chunks from the same page that overlap (the end of one is the start
+   of the next) or contain one another into a single block,
+2. drop blocks that are near-duplicates of a better ranked one (word
+   shingle Jaccard similarity),
+3. pack the remaining blocks, best ranked first, into a token budget measured
+   with tiktoken, truncating the last one that doesn't fit.
+
+Used by rag/chat.py and the rag_queue worker.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+import tiktoken
+from langchain_core.documents import Document
+
+# Max tokens of retrieved context that go into the system prompt
+TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+# Shortest suffix/prefix match that counts as splitter overlap
+MIN_OVERLAP_CHARS = 50
+NEAR_DUPLICATE_SIMILARITY = 0.8
+SHINGLE_SIZE = 5
+# Don't bother adding a truncated block shorter than this
+MIN_BLOCK_TOKENS = 50
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def overlap_merge(first: str, second: str):
+    """Return first+second joined over their shared overlap, or None if they don't overlap."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+
+    longest = min(len(first), len(second))
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def merge_page_chunks(docs):
+    """Merge overlapping chunks that come from the same page, keeping the best rank of each block."""
+    blocks = []  # [rank, text, metadata]
+    for rank, doc in enumerate(docs):
+        text = doc.page_content
+        page = (doc.metadata.get("source"), doc.metadata.get("page_label"))
+
+        for block in blocks:
+            if (block[2].get("source"), block[2].get("page_label")) != page:
+                continue
+            merged = overlap_merge(block[1], text) or overlap_merge(text, block[1])
+            if merged is not None:
+                block[1] = merged
+                break
+        else:
+            blocks.append([rank, text, dict(doc.metadata)])
+
+    return blocks
+
+
+def shingles(text: str):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def drop_near_duplicates(blocks):
+    kept = []
+    for block in sorted(blocks, key=lambda b: b[0]):
+        block_shingles = shingles(block[1])
+        is_duplicate = any(
+            len(block_shingles & other) / len(block_shingles | other) >= NEAR_DUPLICATE_SIMILARITY
+            for _, other in kept
+        )
+        if not is_duplicate:
+            kept.append((block, block_shingles))
+    return [block for block, _ in kept]
+
+
+def pack_context(docs, token_budget: int = TOKEN_BUDGET):
+    """De-duplicate retrieved chunks and fit them into `token_budget` tokens. Returns Documents."""
+    encoding = get_encoding()
+    packed = []
+    remaining = token_budget
+
+    for _, text, metadata in drop_near_duplicates(merge_page_chunks(docs)):
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) > remaining:
+            if remaining < MIN_BLOCK_TOKENS:
+                break
+            text = encoding.decode(tokens[:remaining])
+            tokens = tokens[:remaining]
+        packed.append(Document(page_content=text, metadata=metadata))
+        remaining -= len(tokens)
+        if remaining <= 0:
+            break
+
+    return packed
@@ -0,0 +1,153 @@
+"""
+Concurrent, rate-limit aware embedding for the indexer.
+
+Chunks are embedded in batches with several batches in flight at once. Each
+batch is upserted as soon as its vectors come back, so a failure only ever
+costs that one batch: it is retried on its own and finished batches are never
+redone.
+
+When the provider answers 429 / RESOURCE_EXHAUSTED the limiter halves the
+number of batches allowed in flight and pauses new requests with an
+exponential backoff. Every success lets one more batch back in, up to
+the configured concurrency (additive increase, multiplicative decrease).
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as google_exceptions
+
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# Other errors worth retrying (the rest fail the run straight away)
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    # GoogleGenerativeAIEmbeddings wraps the API error, so walk the cause chain
+    while exc is not None:
+        if getattr(exc, "code", None) == 429 or getattr(exc, "status_code", None) == 429:
+            return True
+        if "RESOURCE_EXHAUSTED" in str(exc):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def is_transient(exc: BaseException) -> bool:
+    while exc is not None:
+        if isinstance(exc, TRANSIENT_ERRORS):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+class AdaptiveLimiter:
+    """Caps requests in flight and backs everyone off together after a 429."""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.active = 0
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.active < self.limit:
+                    self.active += 1
+                    return
+                self.condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, throttled: bool = False):
+        with self.condition:
+            self.active -= 1
+            if throttled:
+                self.throttled += 1
+                self.consecutive_throttles += 1
+                self.limit = max(1, self.limit // 2)
+                backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.consecutive_throttles - 1))
+                # Jitter so the batches don't all come back at the same instant
+                self.paused_until = max(self.paused_until, time.monotonic() + backoff * random.uniform(0.5, 1.0))
+            else:
+                self.consecutive_throttles = 0
+                self.limit = min(self.max_concurrency, self.limit + 1)
+            self.condition.notify_all()
+
+
+class ConcurrentEmbedder:
+    """
+    Embeds and stores batches of chunks on a thread pool.
+
+    `store(batch, vectors)` is called from the pool once a batch's vectors are
+    back. `submit` blocks while 2x concurrency batches are pending, so the
+    caller can stream chunks in without buffering the whole corpus.
+    """
+
+    def __init__(self, embedding_model, store, concurrency: int = 4):
+        self.embedding_model = embedding_model
+        self.store = store
+        self.limiter = AdaptiveLimiter(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.pending = threading.BoundedSemaphore(concurrency * 2)
+        self.futures = []
+        self.embedded = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def submit(self, batch):
+        """Queue a list of Documents for embedding and storage."""
+        # Surface failures early instead of after the whole corpus was parsed
+        for future in [f for f in self.futures if f.done()]:
+            self.futures.remove(future)
+            future.result()
+
+        self.pending.acquire()
+        future = self.executor.submit(self._run, batch)
+        future.add_done_callback(lambda _: self.pending.release())
+        self.futures.append(future)
+
+    def _run(self, batch):
+        texts = [doc.page_content for doc in batch]
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.limiter.acquire()
+            try:
+                vectors = self.embedding_model.embed_documents(texts, batch_size=len(texts))
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                self.limiter.release(throttled=throttled)
+                if attempt == MAX_ATTEMPTS or not (throttled or is_transient(e)):
+                    raise
+                with self.lock:
+                    self.retries += 1
+                if not throttled:
+                    time.sleep(min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempt - 1)))
+                continue
+            self.limiter.release()
+            break
+
+        self.store(batch, vectors)
+        with self.lock:
+            self.embedded += len(batch)
+
+    def close(self):
+        """Wait for every batch and re-raise the first failure."""
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
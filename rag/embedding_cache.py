@@ -0,0 +1,141 @@
+"""
+On-disk embedding cache shared by index.py, chat.py and the rag_queue worker.
+
+CachedEmbeddings wraps any LangChain Embeddings object. Vectors are stored in
+SQLite as float32 blobs keyed by (model + task, sha256 of the text), so a
+string that was embedded once, by any of the three programs, is never sent
+to the API again. The query/document task is part of the key because
+text-embedding-004 embeds the same text differently for retrieval queries
+and documents.
+
+The cache holds at most RAG_EMBEDDING_CACHE_MAX_ENTRIES vectors; beyond that
+the least recently used ones are evicted. Connections, hit/miss counters
+and eviction are handled by SQLiteCache (sqlite_cache.py).
+
+    python embedding_cache.py stats
+    python embedding_cache.py clear
+"""
+
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from sqlite_cache import SQLiteCache
+
+CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", str(Path(__file__).parent / "embedding_cache.sqlite"))
+MAX_ENTRIES = int(os.getenv("RAG_EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# last_used is only rewritten when older than this, so most hits are read-only
+TOUCH_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    vector BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache(SQLiteCache):
+    """SQLite store of float32 vectors, keyed by (model + task, text hash)."""
+
+    SCHEMA = SCHEMA
+    TABLE = "embeddings"
+    KEY = "model, hash"
+    AGE = "last_used"
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def get_many(self, model: str, hashes):
+        """{hash: vector} for the hashes that are cached."""
+        db = self.db
+        found = {}
+        stale = []
+        now = int(time.time())
+        for h in hashes:
+            row = db.execute("SELECT vector, last_used FROM embeddings WHERE model = ? AND hash = ?", (model, h)).fetchone()
+            if row is None:
+                continue
+            found[h] = np.frombuffer(row[0], dtype=np.float32).tolist()
+            if now - row[1] > TOUCH_INTERVAL:
+                stale.append((now, model, h))
+
+        self.count_lookups(len(found), len(set(hashes)) - len(found))
+        if stale:
+            with db:
+                db.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?", stale)
+                self.write_pending(db)
+        else:
+            self.maybe_flush()
+        return found
+
+    def put_many(self, model: str, items):
+        """Store (hash, vector) pairs and evict the least recently used entries above max_entries."""
+        db = self.db
+        now = int(time.time())
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items],
+            )
+            self.write_pending(db)
+            self.evict(db)
+
+
+class CachedEmbeddings(Embeddings):
+    """Drop-in Embeddings wrapper that only calls the wrapped model for uncached texts."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache = None):
+        self.embeddings = embeddings
+        self.cache = cache or EmbeddingCache()
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts, **kwargs):
+        task = kwargs.get("task_type") or "RETRIEVAL_DOCUMENT"
+        return self._embed(texts, f"{self.model}|{task}", lambda missing: self.embeddings.embed_documents(missing, **kwargs))
+
+    def embed_query(self, text, **kwargs):
+        key = f"{self.model}|{kwargs.get('task_type') or 'RETRIEVAL_QUERY'}"
+        return self._embed([text], key, lambda missing: [self.embeddings.embed_query(missing[0], **kwargs)])[0]
+
+    def _embed(self, texts, model, embed):
+        hashes = [text_hash(text) for text in texts]
+        found = self.cache.get_many(model, hashes)
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found:
+                missing.setdefault(h, text)
+        if missing:
+            vectors = embed(list(missing.values()))
+            fresh = list(zip(missing, vectors))
+            self.cache.put_many(model, fresh)
+            found.update(fresh)
+
+        return [found[h] for h in hashes]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = EmbeddingCache()
+    if command == "stats":
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+    elif command == "clear":
+        cache.clear()
+        print(f"Cleared {CACHE_PATH}")
+    else:
+        sys.exit(f"unknown command {command!r}, expected stats or clear")
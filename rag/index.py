@@ -1,10 +1,54 @@
+"""
+Index PDFs into Qdrant.
+
+    python index.py                      # nodejs.pdf next to this script
+    python index.py docs/                # every PDF under a directory
+    python index.py "papers/*.pdf" a.pdf # globs and files
+
+PDFs are parsed in a process pool, one file per worker. Each worker streams
+its pages through the splitter and hands the chunks back over a bounded
+queue, and the chunks are embedded and upserted in batches of --batch-size
+with up to --concurrency batches in flight (see embedder.py), so memory
+stays flat no matter how big the corpus is.
+
+Re-runs are incremental: point ids are derived from the chunk text, and
+index_manifest.json records what the last run stored, so only new chunks are
+embedded and chunks that disappeared from the indexed PDFs are deleted.
+PDFs that are not part of the run keep their points, so a subset can be
+re-indexed on its own; --prune deletes the points of every PDF outside the run.
+
+Every run also rewrites the BM25 index used for hybrid retrieval (lexical.py).
+
+--backend local (or RAG_VECTOR_BACKEND=local) writes to the in-process
+store in local_store.py instead of Qdrant.
+
+RAG_QUANTIZATION=int8|binary keeps quantized vectors in RAM and the float32
+originals on disk (see quantization.py). Changing it doesn't re-embed anything:
+an existing Qdrant collection is reconfigured in place, and the local store
+re-quantizes its vectors.
+"""
+
 from pathlib import Path
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
 from dotenv import load_dotenv
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import resource
+import time
+import uuid
+
+from embedder import ConcurrentEmbedder
+from embedding_cache import CachedEmbeddings
+from lexical import LexicalIndex, LexicalIndexWriter
+from local_store import VECTOR_BACKEND, LocalVectorStore
+from quantization import QUANTIZATION, qdrant_quantization_config
 
 # Load environment variables
 load_dotenv()
@@ -13,33 +57,380 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 
-# Set API key for Gemini
-os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+COLLECTION_NAME = "learning_rag_gemini"
+EMBEDDING_MODEL = "models/text-embedding-004"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 400
+
+INDEX_ROOT = Path(__file__).parent
+default_pdf = INDEX_ROOT / "nodejs.pdf"
+
+# Point ids and chunk metadata of the last run. A re-run only embeds chunks
+# whose text is new, and deletes the points of chunks that disappeared.
+manifest_path = Path(__file__).parent / "index_manifest.json"
+# The local backend keeps its manifest inside the collection directory
+LOCAL_MANIFEST = "index_manifest.json"
+
+# How manifest sources are keyed (see source_key); older manifests used the file name
+SOURCE_KEYS = "relative-path"
+
+# Namespace for deterministic point ids
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "learning_rag_gemini")
+
+# Pages a worker may have handed over but the indexer hasn't consumed yet
+QUEUE_PAGES = 64
+
+# Set in each pool worker by init_worker
+page_queue = None
+
+
+def source_key(path) -> str:
+    """
+    The name a PDF's points and manifest entries are filed under: its resolved
+    path relative to this directory. Same-named PDFs in different directories
+    stay apart, and the ids don't depend on where the checkout lives.
+    """
+    return Path(os.path.relpath(Path(path).resolve(), INDEX_ROOT)).as_posix()
+
+
+def point_id(source: str, content_hash: str, occurrence: int) -> str:
+    # Identical text can appear more than once in a file, hence the occurrence
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\0{content_hash}\0{occurrence}"))
+
+
+class QdrantTarget:
+    manifest_path = manifest_path
+
+    def __init__(self):
+        self.client = QdrantClient(url=QDRANT_URL)
+
+    def exists(self):
+        return self.client.collection_exists(COLLECTION_NAME)
+
+    def recreate(self, dimension: int):
+        if self.exists():
+            self.client.delete_collection(COLLECTION_NAME)
+        self.client.create_collection(
+            collection_name=COLLECTION_NAME,
+            # With quantization only the codes need RAM, the originals are read for rescoring
+            vectors_config=models.VectorParams(
+                size=dimension, distance=models.Distance.COSINE, on_disk=QUANTIZATION != "none"
+            ),
+            quantization_config=qdrant_quantization_config(),
+        )
+
+    def configure(self):
+        # Apply a changed RAG_QUANTIZATION to an existing collection without re-embedding
+        current = self.client.get_collection(COLLECTION_NAME).config.quantization_config
+        wanted = qdrant_quantization_config()
+        if current != wanted:
+            print(f"Setting {COLLECTION_NAME} quantization to {QUANTIZATION}")
+            self.client.update_collection(
+                collection_name=COLLECTION_NAME,
+                vectors_config={"": models.VectorParamsDiff(on_disk=QUANTIZATION != "none")},
+                quantization_config=wanted or models.Disabled.DISABLED,
+            )
+
+    def upsert(self, batch, vectors):
+        self.client.upsert(
+            collection_name=COLLECTION_NAME,
+            points=[
+                models.PointStruct(
+                    id=doc.id,
+                    vector=vector,
+                    payload={"page_content": doc.page_content, "metadata": doc.metadata},
+                )
+                for doc, vector in zip(batch, vectors)
+            ],
+        )
+
+    def update_payloads(self, docs):
+        self.client.batch_update_points(
+            collection_name=COLLECTION_NAME,
+            update_operations=[
+                models.OverwritePayloadOperation(
+                    overwrite_payload=models.SetPayload(
+                        payload={"page_content": doc.page_content, "metadata": doc.metadata},
+                        points=[doc.id],
+                    )
+                )
+                for doc in docs
+            ],
+        )
+
+    def delete(self, ids):
+        self.client.delete(collection_name=COLLECTION_NAME, points_selector=models.PointIdsList(points=ids))
+
+    def changed(self):
+        # Answers cached by the rag_queue worker were built from the old chunks
+        self.client.delete_collection("learning_rag_gemini_answer_cache")
+
+
+class LocalTarget:
+    """Writes to a LocalVectorStore under RAG_LOCAL_INDEX_DIR instead of a Qdrant server."""
+
+    def __init__(self):
+        self.store = LocalVectorStore.open(COLLECTION_NAME)
+        self.manifest_path = self.store.path / LOCAL_MANIFEST
+
+    def exists(self):
+        return LocalVectorStore.exists(COLLECTION_NAME)
+
+    def recreate(self, dimension: int):
+        self.store.delete_collection()
+        self.store.dimension = dimension
+
+    def upsert(self, batch, vectors):
+        self.store.add_embeddings(
+            vectors,
+            [doc.metadata for doc in batch],
+            [doc.id for doc in batch],
+            [doc.page_content for doc in batch],
+        )
+
+    def update_payloads(self, docs):
+        for doc in docs:
+            self.store.update_metadata(doc.id, doc.metadata)
+
+    def delete(self, ids):
+        self.store.delete(ids)
+
+    def configure(self):
+        quantization = self.store.quant["kind"] if self.store.quant is not None else "none"
+        if quantization != QUANTIZATION:
+            print(f"Setting {COLLECTION_NAME} quantization to {QUANTIZATION}")
+            self.store.build_quantized(QUANTIZATION)
+
+    def changed(self):
+        # Rows appended since the last IVF build (or quantization) are scanned
+        # exactly; rebuild once they are no longer a small minority
+        stats = self.store.stats()
+        if self.store.ivf is not None and stats["ivf_unindexed_rows"] > len(self.store) // 10:
+            self.store.build_ivf()
+        if self.store.quant is not None and stats["unquantized_rows"] > len(self.store) // 10:
+            self.store.build_quantized(self.store.quant["kind"])
+
+
+def load_manifest(target, settings):
+    """
+    Previous run's {"points": {point id: metadata}, "sources": {source: [point ids]}},
+    or None if the collection has to be rebuilt.
+    """
+    if not target.manifest_path.exists() or not target.exists():
+        return None
+    manifest = json.loads(target.manifest_path.read_text())
+    # Different chunking or embedding model: none of the old points can be reused
+    if manifest.get("settings") != settings:
+        return None
+    if manifest.get("source_keys") != SOURCE_KEYS:
+        # Written before points were filed by path. Regroup them so the next
+        # run of a PDF replaces its old points rather than keeping both.
+        manifest["sources"] = {}
+        for id, metadata in manifest["points"].items():
+            manifest["sources"].setdefault(source_key(metadata.get("source", "")), []).append(id)
+    return manifest
+
+
+def carry_over_lexical(lexical, ids):
+    """Copy the BM25 entries of points this run didn't touch from the current index."""
+    ids = set(ids)
+    old = LexicalIndex.load(COLLECTION_NAME) if ids else None
+    if old is None:
+        return
+    for row, id in enumerate(old.ids):
+        if id in ids:
+            lexical.add(id, old.texts[row], json.loads(old.metadatas[row]))
+
+
+def find_pdfs(patterns):
+    """Expand directories (recursively) and glob patterns into a sorted list of PDF paths."""
+    paths = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            paths.update(p for p in path.rglob("*") if p.suffix.lower() == ".pdf")
+        elif path.is_file():
+            paths.add(path)
+        else:
+            paths.update(Path(p) for p in glob.glob(pattern, recursive=True) if p.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def init_worker(queue):
+    global page_queue
+    page_queue = queue
+
+
+def parse_pdf(path: str):
+    """Pool task: stream one PDF's pages through the splitter into page_queue."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    try:
+        # lazy_load parses one page at a time instead of the whole file up front
+        for page in PyPDFLoader(file_path=path).lazy_load():
+            page_queue.put(("page", path, text_splitter.split_documents([page])))
+        page_queue.put(("done", path, None))
+    except Exception as e:
+        page_queue.put(("error", path, f"{type(e).__name__}: {e}"))
+
+
+def stream_pages(pdfs, workers: int, failed=None):
+    """Yield (path, chunks) for every page, in page order within each file. Unreadable files go into failed."""
+    ctx = multiprocessing.get_context()
+    queue = ctx.Queue(maxsize=QUEUE_PAGES)
+    remaining = len(pdfs)
+
+    with ctx.Pool(workers, initializer=init_worker, initargs=(queue,)) as pool:
+        for pdf in pdfs:
+            pool.apply_async(parse_pdf, (str(pdf),))
+        pool.close()
+
+        while remaining:
+            kind, path, payload = queue.get()
+            if kind == "page":
+                yield path, payload
+            else:
+                remaining -= 1
+                if kind == "error":
+                    print(f"Skipping {path}: {payload}")
+                    if failed is not None:
+                        failed.append(path)
+        pool.join()
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[str(default_pdf)], help="PDF files, directories or glob patterns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embedding call and upsert")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding batches in flight")
+    parser.add_argument("--prune", action="store_true", help="also delete the points of PDFs that are not part of this run")
+    parser.add_argument("--backend", choices=["qdrant", "local"], default=VECTOR_BACKEND, help="where to store the vectors (RAG_VECTOR_BACKEND)")
+    args = parser.parse_args()
+
+    pdfs = find_pdfs(args.paths)
+    if not pdfs:
+        parser.error("no PDFs found")
+    print(f"Indexing {len(pdfs)} PDF(s) with {args.workers} worker(s)")
+
+    # Set API key for Gemini
+    os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+
+    # Gemini Embedding Model. Chunks embedded before (by an earlier run that
+    # got interrupted, or before a rebuild) come from the local cache.
+    embedding_model = CachedEmbeddings(GoogleGenerativeAIEmbeddings(
+        model=EMBEDDING_MODEL
+    ))
+
+    settings = {"model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    target = LocalTarget() if args.backend == "local" else QdrantTarget()
+    manifest = load_manifest(target, settings)
+
+    if manifest is None:
+        # First run (or a collection built before the manifest existed): index everything
+        print(f"No usable manifest, rebuilding {COLLECTION_NAME}")
+        target.recreate(len(embedding_model.embed_query("dimension probe")))
+        manifest = {"points": {}, "sources": {}}
+    previous = manifest["points"]
+
+    embedder = ConcurrentEmbedder(embedding_model, target.upsert, concurrency=args.concurrency)
+    # BM25 index for hybrid retrieval, rebuilt from every chunk (no API calls involved)
+    lexical = LexicalIndexWriter(COLLECTION_NAME)
+
+    points = {}
+    sources = {}
+    occurrences = {}
+    failed = []
+    to_embed = []
+    updated = pages = 0
+
+    start = time.perf_counter()
+
+    try:
+        for path, page_chunks in stream_pages(pdfs, args.workers, failed):
+            pages += 1
+            payload_updates = []
+            for chunk in page_chunks:
+                source = source_key(path)
+                content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+                occurrence = occurrences.get((source, content_hash), 0)
+                occurrences[(source, content_hash)] = occurrence + 1
+                chunk_id = point_id(source, content_hash, occurrence)
+                points[chunk_id] = chunk.metadata
+                sources.setdefault(source, []).append(chunk_id)
+                lexical.add(chunk_id, chunk.page_content, chunk.metadata)
+
+                if chunk_id not in previous:
+                    chunk.id = chunk_id
+                    to_embed.append(chunk)
+                elif previous[chunk_id] != chunk.metadata:
+                    # Same text but different page number etc.: update the payload, keep the vector
+                    chunk.id = chunk_id
+                    payload_updates.append(chunk)
+
+            if payload_updates:
+                target.update_payloads(payload_updates)
+                updated += len(payload_updates)
+            if len(to_embed) >= args.batch_size:
+                embedder.submit(to_embed)
+                to_embed = []
+
+        if to_embed:
+            embedder.submit(to_embed)
+    finally:
+        embedder.close()
+
+    # Only PDFs this run read completely are replaced; the others keep their
+    # points unless --prune (a PDF that failed to parse is always kept)
+    indexed = {source_key(pdf) for pdf in pdfs} - {source_key(path) for path in failed}
+    unreadable = {source_key(path) for path in failed}
+    kept = {
+        source: ids for source, ids in manifest["sources"].items()
+        if source not in indexed and (not args.prune or source in unreadable)
+    }
+    stale = [
+        i for source, ids in manifest["sources"].items() if source not in kept
+        for i in ids if i not in points
+    ]
+
+    carry_over_lexical(lexical, (i for ids in kept.values() for i in ids))
+    lexical.finish()
+    if stale:
+        target.delete(stale)
+    target.configure()
 
-pdf_path = Path(__file__).parent / "nodejs.pdf"
+    chunks = len(points)
+    for source, ids in kept.items():
+        # A PDF that failed halfway keeps its old points and the new ones it got to
+        sources[source] = list(dict.fromkeys(ids + sources.get(source, [])))
+        points.update((i, previous[i]) for i in ids)
+    target.manifest_path.write_text(json.dumps({"settings": settings, "source_keys": SOURCE_KEYS, "points": points, "sources": sources}))
 
-# Load PDF
-loader = PyPDFLoader(file_path=str(pdf_path))
-docs = loader.load()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{pages} pages, {chunks} chunks: {embedder.embedded} embedded, {updated} payloads updated, "
+        f"{len(stale)} deleted in {elapsed:.1f}s ({pages / elapsed if elapsed else 0:.1f} pages/sec)"
+    )
+    print(
+        f"Peak RSS: indexer {peak_rss_mb(resource.RUSAGE_SELF):.0f} MB, "
+        f"largest parser worker {peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB"
+    )
+    print(f"Embedding: {embedder.retries} batch retries, {embedder.limiter.throttled} rate limited responses")
+    cache_stats = embedding_model.cache.stats()
+    print(f"Embedding cache: {cache_stats['entries']} entries, lifetime hit rate {cache_stats['hit_rate']}")
 
-# Split into chunks
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=400
-)
-chunks = text_splitter.split_documents(docs)
+    if embedder.embedded or updated or stale:
+        target.changed()
 
-# Gemini Embedding Model
-embedding_model = GoogleGenerativeAIEmbeddings(
-    model="models/text-embedding-004"
-)
+    print("Indexing of documents done with Gemini....")
 
-# Qdrant Vector Store
-vector_store = QdrantVectorStore.from_documents(
-    documents=chunks,
-    embedding=embedding_model,
-    url=QDRANT_URL,
-    collection_name="learning_rag_gemini",
-)
 
-print("Indexing of documents done with Gemini....")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+BM25 keyword retrieval and reciprocal rank fusion with the vector results.
+
+Dense retrieval is weak on exact API names (`fs.createReadStream`,
+`process.nextTick`). index.py therefore also writes a BM25 inverted index of
+every chunk next to the vector collection, and hybrid_search() merges the two
+rankings with reciprocal rank fusion:
+
+    score(chunk) = sum over rankings of 1 / (RRF_K + rank)
+
+Dotted identifiers are indexed whole and by part, so "createReadStream",
+"fs.createReadStream" and "fs" all match a chunk that mentions
+fs.createReadStream().
+
+The index is a single .npz (postings in CSR layout plus the chunk texts and
+metadata as UTF-8 blobs), replaced atomically on every index run.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+LEXICAL_INDEX_DIR = Path(os.getenv("RAG_LEXICAL_INDEX_DIR", str(Path(__file__).parent / "lexical_index")))
+HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Candidates taken from each retriever before fusion
+CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*|\d+")
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it of on or that the this to use what when "
+    "where which why with work works you".split()
+)
+
+
+def tokenize(text: str):
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        token = match.group().lower()
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "." in token:
+            tokens.extend(part for part in token.split(".") if part and part not in STOPWORDS)
+    return tokens
+
+
+def index_path(collection_name: str) -> Path:
+    return LEXICAL_INDEX_DIR / f"{collection_name}.npz"
+
+
+def pack_strings(strings):
+    """UTF-8 blob plus offsets, so texts can live in an .npz without pickling."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class LexicalIndexWriter:
+    """Collects chunks during an index run and writes the BM25 index at the end."""
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.lengths = []
+        self.postings = {}  # term -> ([doc rows], [term frequencies])
+
+    def add(self, id: str, text: str, metadata: dict):
+        row = len(self.ids)
+        self.ids.append(id)
+        self.texts.append(text)
+        self.metadatas.append(json.dumps(metadata, separators=(",", ":")))
+        tokens = tokenize(text)
+        self.lengths.append(len(tokens))
+
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            rows, tfs = self.postings.setdefault(token, ([], []))
+            rows.append(row)
+            tfs.append(count)
+
+    def finish(self, path=None):
+        """Write the index (to LEXICAL_INDEX_DIR unless a path is given) and return its path."""
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self.postings[t][0]) for t in terms], out=offsets[1:])
+        term_bytes, term_offsets = pack_strings(terms)
+        text_bytes, text_offsets = pack_strings(self.texts)
+        meta_bytes, meta_offsets = pack_strings(self.metadatas)
+        id_bytes, id_offsets = pack_strings(self.ids)
+
+        path = Path(path) if path else index_path(self.collection_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp,
+            term_bytes=term_bytes,
+            term_offsets=term_offsets,
+            posting_offsets=offsets,
+            posting_rows=np.fromiter((row for t in terms for row in self.postings[t][0]), dtype=np.int32),
+            posting_tfs=np.fromiter((tf for t in terms for tf in self.postings[t][1]), dtype=np.float32),
+            lengths=np.asarray(self.lengths, dtype=np.float32),
+            text_bytes=text_bytes,
+            text_offsets=text_offsets,
+            meta_bytes=meta_bytes,
+            meta_offsets=meta_offsets,
+            id_bytes=id_bytes,
+            id_offsets=id_offsets,
+        )
+        # Readers either see the old index or the new one, never half of each
+        os.replace(tmp, path)
+        return path
+
+
+class LexicalIndex:
+    def __init__(self, path, collection_name: str = None):
+        self.collection_name = collection_name or Path(path).stem
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        def unpack(name):
+            blob, offsets = arrays[f"{name}_bytes"].tobytes(), arrays[f"{name}_offsets"]
+            return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+        self.terms = {term: i for i, term in enumerate(unpack("term"))}
+        self.ids = unpack("id")
+        self.texts = unpack("text")
+        self.metadatas = unpack("meta")  # decoded lazily, most are never returned
+        self.posting_offsets = arrays["posting_offsets"]
+        self.posting_rows = arrays["posting_rows"]
+        self.posting_tfs = arrays["posting_tfs"]
+        self.lengths = arrays["lengths"]
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+
+        doc_freq = np.diff(self.posting_offsets).astype(np.float32)
+        n = len(self.ids)
+        # Lucene's BM25 idf, which stays positive even for terms in most chunks
+        self.idf = np.log(1 + (n - doc_freq + 0.5) / (doc_freq + 0.5))
+        # Per-document part of the BM25 denominator
+        self.norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(self.average_length, 1e-9))
+
+    @classmethod
+    def load(cls, collection_name: str):
+        """The collection's BM25 index, or None if index.py hasn't written one yet."""
+        path = index_path(collection_name)
+        return cls(path, collection_name) if path.exists() else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int = CANDIDATES):
+        """[(Document, bm25 score)] best first."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.terms.get(token)
+            if term is None:
+                continue
+            start, end = self.posting_offsets[term], self.posting_offsets[term + 1]
+            rows, tfs = self.posting_rows[start:end], self.posting_tfs[start:end]
+            scores[rows] += self.idf[term] * tfs * (BM25_K1 + 1) / (tfs + self.norms[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(self.document(row), float(scores[row])) for row in matched]
+
+    def document(self, row: int):
+        metadata = json.loads(self.metadatas[row])
+        # Same extra keys as the vector store results, so fusion can match them up
+        metadata["_id"] = self.ids[row]
+        metadata["_collection_name"] = self.collection_name
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=metadata)
+
+
+def reciprocal_rank_fusion(rankings, k: int, rrf_k: int = RRF_K):
+    """Merge ranked Document lists (matched by metadata["_id"]) and keep the top k."""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.metadata.get("_id")
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+def fuse(query: str, dense, lexical_index, k: int = 4):
+    """Fuse vector candidates for a query with its BM25 results; without an index just keep the top k."""
+    if lexical_index is None:
+        return dense[:k]
+    sparse = [doc for doc, _ in lexical_index.search(query, CANDIDATES)]
+    return reciprocal_rank_fusion([dense, sparse], k)
+
+
+def hybrid_search(vector_store, lexical_index, query: str, embedding, k: int = 4, **search_kwargs):
+    """Top k chunks for a query by RRF over vector and BM25 candidates (search_kwargs go to the vector store)."""
+    # At least k vector candidates, so a reranker asking for more than CANDIDATES gets them
+    dense = vector_store.similarity_search_by_vector(
+        embedding, k=max(CANDIDATES, k) if lexical_index is not None else k, **search_kwargs
+    )
+    return fuse(query, dense, lexical_index, k)
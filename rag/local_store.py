@@ -0,0 +1,490 @@
+"""
+In-process vector store, a drop-in for QdrantVectorStore when no server is wanted.
+
+A collection is a directory:
+
+* vectors.f32  float32 matrix of unit-length vectors, memory-mapped, grown by
+               doubling. Cosine similarity is a plain dot product.
+* log.jsonl    append-only record of adds, deletes and metadata updates;
+               replayed on open, rewritten by compact().
+* ivf.npz      optional inverted-file index (see build_ivf).
+* quant.npz    optional int8 or binary codes of the vectors (see quantization.py).
+
+Search is exact by default: one matmul over the whole matrix (or one per
+batch of queries), which takes well under a millisecond for a few thousand
+chunks. For larger collections build_ivf() clusters the vectors with
+spherical k-means, and queries then only score the rows in the RAG_LOCAL_NPROBE
+closest clusters. Rows added after the index was built are always scanned
+exactly, so the index never returns stale results, only slightly slower ones.
+
+With build_quantized() the first pass scores the int8/binary codes, which are
+held in RAM, and only the oversampled shortlist is read from the float32 file
+for rescoring. This works on its own or inside the IVF lists.
+
+LocalVectorStore implements the LangChain VectorStore interface the repo uses
+(similarity_search, similarity_search_by_vector, ..._with_score, add_texts,
+delete, get_by_ids) plus add_embeddings, so mem0's "langchain" provider can
+use it too. RAG_VECTOR_BACKEND=local switches chat.py, index.py and the
+rag_queue worker over.
+
+    python local_store.py stats [collection]
+    python local_store.py build-ivf [collection] [--nlist N]
+    python local_store.py quantize [collection] [--kind int8|binary|none]
+    python local_store.py import-qdrant [collection]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from quantization import OVERSAMPLING, QUANTIZATION, approximate_scores, int8_scale, quantize
+
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "qdrant")
+LOCAL_INDEX_DIR = Path(os.getenv("RAG_LOCAL_INDEX_DIR", str(Path(__file__).parent / "local_index")))
+# Clusters scanned per query when an IVF index exists (0 = always exact)
+NPROBE = int(os.getenv("RAG_LOCAL_NPROBE", "8"))
+
+INITIAL_CAPACITY = 1024
+# Rows scored per matmul while building the IVF index, to bound memory
+ASSIGN_BLOCK = 65536
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k: int):
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def matches(metadata: dict, filter: dict) -> bool:
+    # Equality per key; a list means "any of"
+    for key, expected in filter.items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, path, embedding=None, dimension: int = None, collection_name: str = None):
+        self.path = Path(path)
+        self.embedding = embedding
+        self.collection_name = collection_name or self.path.name
+        self.lock = threading.RLock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.ids = []          # row -> id
+        self.rows = {}         # id -> row
+        self.texts = []
+        self.metadatas = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.count = 0
+        self.vectors = None
+        self.ivf = None
+        self.quant = None
+
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            self.dimension = json.loads(meta_path.read_text())["dimension"]
+            self._open_vectors()
+            self._replay_log()
+            self._load_ivf()
+            self._load_quantized()
+        else:
+            self.dimension = dimension
+
+    @classmethod
+    def open(cls, collection_name: str, embedding=None, dimension: int = None):
+        """Open (or create) a collection under RAG_LOCAL_INDEX_DIR."""
+        return cls(LOCAL_INDEX_DIR / collection_name, embedding, dimension, collection_name)
+
+    @staticmethod
+    def exists(collection_name: str) -> bool:
+        return (LOCAL_INDEX_DIR / collection_name / "meta.json").exists()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    # ---- storage ----
+
+    def _open_vectors(self, capacity: int = None):
+        file = self.path / "vectors.f32"
+        row_bytes = self.dimension * 4
+        if capacity is None:
+            capacity = max(INITIAL_CAPACITY, file.stat().st_size // row_bytes if file.exists() else 0)
+        if not file.exists() or file.stat().st_size < capacity * row_bytes:
+            with open(file, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self.vectors = np.memmap(file, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def _ensure_capacity(self, rows: int):
+        if self.vectors is None:
+            (self.path / "meta.json").write_text(json.dumps({"dimension": self.dimension}))
+            self._open_vectors()
+        capacity = len(self.vectors)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        self.vectors.flush()
+        self._open_vectors(capacity)
+
+    def _append_log(self, entries):
+        with open(self.path / "log.jsonl", "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def _replay_log(self):
+        log = self.path / "log.jsonl"
+        if not log.exists():
+            return
+        with open(log, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["op"] == "add":
+                    self._apply_add(entry["row"], entry["id"], entry["text"], entry["metadata"])
+                elif entry["op"] == "delete":
+                    self._apply_delete(entry["id"])
+                elif entry["op"] == "metadata":
+                    self.metadatas[self.rows[entry["id"]]] = entry["metadata"]
+
+    def _apply_add(self, row, id, text, metadata):
+        if id in self.rows:
+            self._apply_delete(id)
+        while len(self.ids) <= row:
+            self.ids.append(None)
+            self.texts.append(None)
+            self.metadatas.append(None)
+        if len(self.alive) <= row:
+            self.alive = np.concatenate([self.alive, np.zeros(max(row + 1, 2 * len(self.alive)) - len(self.alive), dtype=bool)])
+        self.ids[row], self.texts[row], self.metadatas[row] = id, text, metadata
+        self.rows[id] = row
+        self.alive[row] = True
+        self.count = max(self.count, row + 1)
+
+    def _apply_delete(self, id):
+        row = self.rows.pop(id, None)
+        if row is not None:
+            self.alive[row] = False
+            self.texts[row] = self.metadatas[row] = None
+
+    def _load_ivf(self):
+        file = self.path / "ivf.npz"
+        if file.exists():
+            with np.load(file) as data:
+                self.ivf = {name: data[name] for name in data.files}
+
+    def _load_quantized(self):
+        file = self.path / "quant.npz"
+        if file.exists():
+            with np.load(file) as data:
+                self.quant = {name: data[name] for name in data.files}
+            self.quant["kind"] = str(self.quant["kind"])
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ---- writes ----
+
+    def add_embeddings(self, embeddings, metadatas=None, ids=None, texts=None, **kwargs):
+        """Add pre-computed vectors. Existing ids are replaced."""
+        embeddings = normalize(embeddings)
+        n = len(embeddings)
+        metadatas = metadatas or [{} for _ in range(n)]
+        texts = texts or [m.get("data", "") for m in metadatas]
+        ids = [str(i) for i in ids] if ids else [str(i) for i in range(self.count, self.count + n)]
+
+        with self.lock:
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+            start = self.count
+            self._ensure_capacity(start + n)
+            self.vectors[start:start + n] = embeddings
+            # Vectors first, so a logged row always has its vector on disk
+            self.vectors.flush()
+            entries = []
+            for offset, (id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                self._apply_add(start + offset, id, text, metadata)
+                entries.append({"op": "add", "row": start + offset, "id": id, "text": text, "metadata": metadata})
+            self._append_log(entries)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(self.embedding.embed_documents(texts), metadatas, ids, texts)
+
+    def update_metadata(self, id, metadata: dict):
+        with self.lock:
+            self.metadatas[self.rows[id]] = metadata
+            self._append_log([{"op": "metadata", "id": id, "metadata": metadata}])
+
+    def delete(self, ids=None, **kwargs):
+        with self.lock:
+            ids = list(self.rows) if ids is None else [str(i) for i in ids]
+            for id in ids:
+                self._apply_delete(id)
+            self._append_log({"op": "delete", "id": id} for id in ids)
+        return True
+
+    def delete_collection(self):
+        with self.lock:
+            self.vectors = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.__init__(self.path, self.embedding, self.dimension, self.collection_name)
+
+    def compact(self):
+        """Drop deleted rows from the vector file and the log (invalidates the IVF index and quantized codes)."""
+        with self.lock:
+            live = np.flatnonzero(self.alive[:self.count])
+            vectors = np.array(self.vectors[live]) if len(live) else np.zeros((0, self.dimension), np.float32)
+            records = [(self.ids[r], self.texts[r], self.metadatas[r]) for r in live]
+            self.vectors = None
+            shutil.rmtree(self.path)
+            self.__init__(self.path, self.embedding, self.dimension, self.collection_name)
+            if records:
+                ids, texts, metadatas = zip(*records)
+                self.add_embeddings(vectors, list(metadatas), list(ids), list(texts))
+
+    # ---- approximate index ----
+
+    def build_ivf(self, nlist: int = None, iterations: int = 10, seed: int = 0):
+        """Cluster the live rows with spherical k-means into nlist inverted lists."""
+        with self.lock:
+            live = np.flatnonzero(self.alive[:self.count])
+            nlist = min(nlist or max(1, int(4 * np.sqrt(len(live)))), len(live))
+            rng = np.random.default_rng(seed)
+            centroids = np.array(self.vectors[rng.choice(live, nlist, replace=False)])
+
+            for _ in range(iterations):
+                assignment = self._assign(live, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, self.vectors[live])
+                empty = np.bincount(assignment, minlength=nlist) == 0
+                # Re-seed empty clusters with random rows
+                sums[empty] = self.vectors[rng.choice(live, int(empty.sum()))]
+                centroids = normalize(sums)
+
+            assignment = self._assign(live, centroids)
+            order = np.argsort(assignment, kind="stable")
+            self.ivf = {
+                "centroids": centroids,
+                "rows": live[order],
+                "offsets": np.searchsorted(assignment[order], np.arange(nlist + 1)),
+                "covered": np.array(self.count),
+            }
+            np.savez(self.path / "ivf.npz", **self.ivf)
+
+    def build_quantized(self, kind: str = QUANTIZATION):
+        """Quantize every row into RAM-resident codes ("none" drops them)."""
+        with self.lock:
+            file = self.path / "quant.npz"
+            if kind == "none":
+                file.unlink(missing_ok=True)
+                self.quant = None
+                return
+            live = np.flatnonzero(self.alive[:self.count])
+            scale = int8_scale(self.vectors[live]) if kind == "int8" else 1.0
+            codes = np.concatenate([
+                quantize(self.vectors[start:min(start + ASSIGN_BLOCK, self.count)], kind, scale)
+                for start in range(0, self.count, ASSIGN_BLOCK)
+            ])
+            self.quant = {"kind": kind, "scale": np.array(scale), "codes": codes, "covered": np.array(self.count)}
+            np.savez(file, **self.quant)
+
+    def _shortlist(self, query, rows, k: int, oversampling: float):
+        """The k * oversampling best rows by quantized score, plus rows quantized after the build."""
+        quant = self.quant
+        covered = int(quant["covered"])
+        indexed, tail = rows[rows < covered], rows[rows >= covered]
+        if len(indexed) == covered:
+            # Every quantized row is a candidate: score the codes in place instead of copying them
+            scores = approximate_scores(quant["codes"], query, quant["kind"])
+        else:
+            scores = approximate_scores(quant["codes"][indexed], query, quant["kind"])
+        keep = indexed[top_k(scores, int(np.ceil(k * oversampling)))]
+        return np.concatenate([keep, tail])
+
+    def _assign(self, rows, centroids):
+        assignment = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), ASSIGN_BLOCK):
+            block = rows[start:start + ASSIGN_BLOCK]
+            assignment[start:start + len(block)] = np.argmax(self.vectors[block] @ centroids.T, axis=1)
+        return assignment
+
+    def _candidates(self, query, nprobe: int):
+        """Rows to score for one query: the nprobe closest lists plus rows added after the IVF build."""
+        ivf = self.ivf
+        lists = top_k(ivf["centroids"] @ query, nprobe)
+        offsets = ivf["offsets"]
+        rows = [ivf["rows"][offsets[c]:offsets[c + 1]] for c in lists]
+        rows.append(np.arange(int(ivf["covered"]), self.count))
+        rows = np.concatenate(rows)
+        return rows[self.alive[rows]]
+
+    # ---- search ----
+
+    def _search(self, queries, k: int, filter: dict = None, nprobe: int = None, oversampling: float = None):
+        """[(rows, scores)] per query."""
+        queries = normalize(queries)
+        nprobe = NPROBE if nprobe is None else nprobe
+        oversampling = OVERSAMPLING if oversampling is None else oversampling
+        count = self.count
+        if count == 0:
+            return [(np.empty(0, np.int64), np.empty(0, np.float32)) for _ in queries]
+
+        if filter:
+            allowed = np.flatnonzero([
+                alive and matches(metadata, filter)
+                for alive, metadata in zip(self.alive[:count], self.metadatas[:count])
+            ])
+            scores = queries @ self.vectors[allowed].T
+            return [(allowed[best], s[best]) for s in scores for best in [top_k(s, k)]]
+
+        use_ivf = self.ivf is not None and nprobe > 0
+        use_quant = self.quant is not None and oversampling > 0
+        if use_ivf or use_quant:
+            results = []
+            for query in queries:
+                rows = self._candidates(query, nprobe) if use_ivf else np.flatnonzero(self.alive[:count])
+                if use_quant:
+                    rows = self._shortlist(query, rows, k, oversampling)
+                # Full-precision rescoring of the remaining candidates
+                scores = self.vectors[rows] @ query
+                best = top_k(scores, k)
+                results.append((rows[best], scores[best]))
+            return results
+
+        scores = queries @ self.vectors[:count].T
+        scores[:, ~self.alive[:count]] = -np.inf
+        results = []
+        for s in scores:
+            best = top_k(s, min(k, len(self.rows)))
+            results.append((best, s[best]))
+        return results
+
+    def _document(self, row):
+        metadata = dict(self.metadatas[row])
+        # Same extra keys QdrantVectorStore adds, so callers can rely on them
+        metadata["_id"] = self.ids[row]
+        metadata["_collection_name"] = self.collection_name
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=metadata)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        [(rows, scores)] = self._search([embedding], k, filter, kwargs.get("nprobe"), kwargs.get("oversampling"))
+        return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter, **kwargs)]
+
+    def similarity_search_by_vector_batch(self, embeddings, k: int = 4, filter: dict = None, **kwargs):
+        """One list of Documents per query vector, scored with a single matmul when searching exactly."""
+        return [
+            [self._document(row) for row in rows]
+            for rows, _ in self._search(embeddings, k, filter, kwargs.get("nprobe"), kwargs.get("oversampling"))
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already
+        return lambda score: score
+
+    def get_by_ids(self, ids):
+        return [self._document(self.rows[str(i)]) for i in ids if str(i) in self.rows]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, collection_name: str = "local", **kwargs):
+        store = cls.open(collection_name, embedding)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    def stats(self):
+        return {
+            "collection": self.collection_name,
+            "dimension": self.dimension,
+            "points": len(self.rows),
+            "rows": self.count,
+            "deleted_rows": self.count - len(self.rows),
+            "vector_file_bytes": (self.path / "vectors.f32").stat().st_size if self.vectors is not None else 0,
+            "ivf_lists": len(self.ivf["centroids"]) if self.ivf is not None else 0,
+            "ivf_unindexed_rows": self.count - int(self.ivf["covered"]) if self.ivf is not None else self.count,
+            "quantization": self.quant["kind"] if self.quant is not None else "none",
+            "quantized_bytes": self.quant["codes"].nbytes if self.quant is not None else 0,
+            "unquantized_rows": self.count - int(self.quant["covered"]) if self.quant is not None else self.count,
+        }
+
+
+def import_qdrant(collection_name: str, batch: int = 256):
+    """Copy a Qdrant collection written by QdrantVectorStore into a local collection."""
+    from qdrant_client import QdrantClient
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"))
+    store = LocalVectorStore.open(collection_name)
+    store.delete_collection()
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name, limit=batch, offset=offset, with_vectors=True, with_payload=True)
+        if points:
+            store.add_embeddings(
+                [p.vector for p in points],
+                [p.payload.get("metadata", {}) for p in points],
+                [str(p.id) for p in points],
+                [p.payload.get("page_content", "") for p in points],
+            )
+        if offset is None:
+            return store
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["stats", "build-ivf", "quantize", "import-qdrant", "compact"])
+    parser.add_argument("collection", nargs="?", default="learning_rag_gemini")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default 4*sqrt(points))")
+    parser.add_argument("--kind", choices=["int8", "binary", "none"], default=QUANTIZATION, help="quantization for quantize")
+    args = parser.parse_args()
+
+    if args.command == "import-qdrant":
+        store = import_qdrant(args.collection)
+    else:
+        if not LocalVectorStore.exists(args.collection):
+            parser.error(f"no local collection {args.collection} in {LOCAL_INDEX_DIR}")
+        store = LocalVectorStore.open(args.collection)
+        if args.command == "build-ivf":
+            store.build_ivf(args.nlist)
+        elif args.command == "quantize":
+            store.build_quantized(args.kind)
+        elif args.command == "compact":
+            store.compact()
+
+    for name, value in store.stats().items():
+        print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Second-stage reranking of retrieved chunks.
+
+Retrieval over-fetches RAG_RERANK_CANDIDATES chunks, a scorer reads each
+(query, chunk) pair, and only the RAG_RERANK_TOP_N best go into the prompt.
+Fewer, better chunks make the prompt smaller and generation faster.
+
+RAG_RERANK picks the scorer:
+
+* none           no reranking, the first-stage top k is used as is
+* lexical        idf-weighted coverage of the query terms, with a bonus for
+                 the exact dotted names (fs.createReadStream) of the query.
+                 Pure Python, well under a millisecond per chunk.
+* cross-encoder  a sentence-transformers CrossEncoder (RAG_CROSS_ENCODER_MODEL),
+                 run locally on CPU. Needs `pip install sentence-transformers`.
+
+Scores are cached in SQLite per (scorer, query hash, chunk id), so a repeated
+question, or a chunk that comes back for the same question after a
+re-index, is never scored twice. Chunk ids are derived from the chunk text
+(see index.py), so a cached score can't outlive the text it was computed
+for. The cache shares its SQLite handling with the embedding cache
+(sqlite_cache.py).
+
+    python rerank.py stats
+    python rerank.py clear
+"""
+
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+from lexical import LexicalIndex, tokenize
+from sqlite_cache import SQLiteCache
+
+RERANK = os.getenv("RAG_RERANK", "lexical")
+# Chunks fetched by the first stage for the scorer to choose from
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "12"))
+# Chunks kept for the prompt
+RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", "3"))
+CROSS_ENCODER_MODEL = os.getenv("RAG_CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+CACHE_PATH = os.getenv("RAG_RERANK_CACHE_PATH", str(Path(__file__).parent / "rerank_cache.sqlite"))
+MAX_ENTRIES = int(os.getenv("RAG_RERANK_CACHE_MAX_ENTRIES", "500000"))
+
+# Added to the lexical score per dotted query name found verbatim in a chunk
+EXACT_NAME_BONUS = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    scorer TEXT NOT NULL,
+    query BLOB NOT NULL,
+    chunk TEXT NOT NULL,
+    score REAL NOT NULL,
+    created INTEGER NOT NULL,
+    PRIMARY KEY (scorer, query, chunk)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scores_created ON scores (created);
+"""
+
+
+def query_hash(query: str) -> bytes:
+    return hashlib.sha256(" ".join(query.split()).encode("utf-8")).digest()
+
+
+class LexicalOverlapScorer:
+    """Share of the query's idf weight whose terms occur in the chunk."""
+
+    def __init__(self, lexical_index: LexicalIndex = None):
+        self.lexical_index = lexical_index
+        self.name = "lexical"
+
+    def idf(self, token: str) -> float:
+        if self.lexical_index is None:
+            return 1.0
+        term = self.lexical_index.terms.get(token)
+        # Terms the corpus has never seen say little about relevance
+        return float(self.lexical_index.idf[term]) if term is not None else 0.5
+
+    def score(self, query: str, texts):
+        weights = {token: self.idf(token) for token in tokenize(query)}
+        total = sum(weights.values())
+        names = [token for token in weights if "." in token]
+        scores = []
+        for text in texts:
+            tokens = set(tokenize(text))
+            coverage = sum(w for token, w in weights.items() if token in tokens) / total if total else 0.0
+            lowered = text.lower()
+            scores.append(coverage + EXACT_NAME_BONUS * sum(name in lowered for name in names))
+        return scores
+
+
+class CrossEncoderScorer:
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.name = f"cross-encoder|{model_name}"
+
+    def score(self, query: str, texts):
+        return [float(s) for s in self.model.predict([(query, text) for text in texts])]
+
+
+class ScoreCache(SQLiteCache):
+    """SQLite store of rerank scores, keyed by (scorer, query hash, chunk id)."""
+
+    SCHEMA = SCHEMA
+    TABLE = "scores"
+    KEY = "scorer, query, chunk"
+    AGE = "created"
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def get_many(self, scorer: str, query: bytes, chunks):
+        """{chunk id: score} for the chunks that are cached."""
+        db = self.db
+        found = {}
+        for chunk in chunks:
+            row = db.execute(
+                "SELECT score FROM scores WHERE scorer = ? AND query = ? AND chunk = ?", (scorer, query, chunk)
+            ).fetchone()
+            if row is not None:
+                found[chunk] = row[0]
+        self.count_lookups(len(found), len(set(chunks)) - len(found))
+        self.maybe_flush()
+        return found
+
+    def put_many(self, scorer: str, query: bytes, items):
+        """Store (chunk id, score) pairs and evict the oldest entries above max_entries."""
+        db = self.db
+        now = int(time.time())
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)",
+                [(scorer, query, chunk, float(score), now) for chunk, score in items],
+            )
+            self.write_pending(db)
+            self.evict(db)
+
+
+class Reranker:
+    def __init__(self, scorer, cache: ScoreCache = None, top_n: int = RERANK_TOP_N):
+        self.scorer = scorer
+        self.cache = cache or ScoreCache()
+        self.top_n = top_n
+
+    def rerank(self, query: str, docs, top_n: int = None):
+        """The top_n docs by scorer, best first; the score goes into metadata["_rerank_score"]."""
+        if not docs:
+            return docs
+        key = query_hash(query)
+        ids = [doc.metadata.get("_id") or doc.id for doc in docs]
+        scores = self.cache.get_many(self.scorer.name, key, ids)
+
+        missing = [(id, doc.page_content) for id, doc in zip(ids, docs) if id not in scores]
+        if missing:
+            fresh = list(zip([id for id, _ in missing], self.scorer.score(query, [text for _, text in missing])))
+            self.cache.put_many(self.scorer.name, key, fresh)
+            scores.update(fresh)
+
+        # sorted() is stable, so equal scores keep the first-stage order
+        order = sorted(range(len(docs)), key=lambda i: -scores[ids[i]])
+        best = [docs[i] for i in order[:top_n or self.top_n]]
+        for doc in best:
+            doc.metadata["_rerank_score"] = scores[doc.metadata.get("_id") or doc.id]
+        return best
+
+
+def make_scorer(name: str = RERANK, lexical_index: LexicalIndex = None):
+    if name == "lexical":
+        return LexicalOverlapScorer(lexical_index)
+    if name == "cross-encoder":
+        return CrossEncoderScorer()
+    raise ValueError(f"unknown scorer {name!r}, expected none, lexical or cross-encoder")
+
+
+def make_reranker(lexical_index: LexicalIndex = None):
+    """The RAG_RERANK reranker, or None when disabled. The lexical scorer takes its idf from lexical_index."""
+    if RERANK == "none":
+        return None
+    return Reranker(make_scorer(RERANK, lexical_index))
+
+
+def retrieve_k(k: int) -> int:
+    """How many chunks the first stage should return when the final count is k."""
+    return max(k, RERANK_CANDIDATES) if RERANK != "none" else k
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = ScoreCache()
+    if command == "stats":
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+    elif command == "clear":
+        cache.clear()
+        print(f"Cleared {CACHE_PATH}")
+    else:
+        sys.exit(f"unknown command {command!r}, expected stats or clear")
@@ -0,0 +1,126 @@
+"""
+Base class for the SQLite caches in rag/ (embedding_cache.py, rerank.py).
+
+A subclass declares its table: SCHEMA creates it, TABLE names it, KEY lists
+its primary key columns and AGE the column that eviction goes by, oldest
+first. It reads and writes its own rows; this class takes care of the rest:
+
+* one connection per thread and process, in WAL mode, so several readers
+  and one writer can use the file at the same time,
+* hit/miss counters, kept in memory and written along with other writes,
+  at most every STATS_FLUSH_SECONDS, or on flush_stats(), so lookups that
+  hit stay read-only,
+* eviction down to EVICT_TO of max_entries once it is exceeded,
+* stats() and clear().
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+# Evict down to this fraction of max_entries so eviction doesn't run on every insert
+EVICT_TO = 0.9
+# Longest a process keeps hit/miss counts to itself without another write to piggyback on
+STATS_FLUSH_SECONDS = 30
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+"""
+
+
+class SQLiteCache:
+    SCHEMA = ""
+    TABLE = ""
+    KEY = ""
+    AGE = ""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending = {}  # stats name -> count not written yet
+        self.pending_pid = os.getpid()
+        self.last_flush = time.monotonic()
+        atexit.register(self.flush_stats)
+
+    @property
+    def db(self):
+        # Connections must not cross a fork (rq work horses, index.py's pool)
+        if getattr(self.local, "pid", None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA + STATS_SCHEMA)
+            self.local.db, self.local.pid = db, os.getpid()
+        return self.local.db
+
+    def count_lookups(self, hits: int, misses: int):
+        with self.lock:
+            self._own_pending()
+            self.pending["hits"] = self.pending.get("hits", 0) + hits
+            self.pending["misses"] = self.pending.get("misses", 0) + misses
+
+    def maybe_flush(self):
+        """flush_stats() if the counts have been kept back for STATS_FLUSH_SECONDS."""
+        if time.monotonic() - self.last_flush > STATS_FLUSH_SECONDS:
+            self.flush_stats()
+
+    def _own_pending(self):
+        # Counts inherited across a fork are the parent's to write
+        if self.pending_pid != os.getpid():
+            self.pending, self.pending_pid = {}, os.getpid()
+
+    def write_pending(self, db):
+        """Add the pending counts to the stats table, inside the caller's transaction."""
+        with self.lock:
+            self._own_pending()
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        for name, value in pending.items():
+            if value:
+                db.execute("UPDATE stats SET value = value + ? WHERE name = ?", (value, name))
+
+    def flush_stats(self):
+        """Write the pending hit/miss counts, e.g. before a forked process exits without atexit."""
+        with self.lock:
+            self._own_pending()
+            if not any(self.pending.values()):
+                return
+        with self.db as db:
+            self.write_pending(db)
+
+    def evict(self, db):
+        """Drop the oldest entries above max_entries, inside the caller's transaction."""
+        count = db.execute(f"SELECT count(*) FROM {self.TABLE}").fetchone()[0]
+        if self.max_entries and count > self.max_entries:
+            excess = count - int(self.max_entries * EVICT_TO)
+            db.execute(
+                f"DELETE FROM {self.TABLE} WHERE ({self.KEY}) IN "
+                f"(SELECT {self.KEY} FROM {self.TABLE} ORDER BY {self.AGE} LIMIT ?)",
+                (excess,),
+            )
+            db.execute("UPDATE stats SET value = value + ? WHERE name = 'evictions'", (excess,))
+
+    def stats(self):
+        self.flush_stats()
+        db = self.db
+        counters = dict(db.execute("SELECT name, value FROM stats"))
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+            "entries": db.execute(f"SELECT count(*) FROM {self.TABLE}").fetchone()[0],
+            "max_entries": self.max_entries,
+            "size_bytes": os.path.getsize(self.path),
+        }
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+        with self.db as db:
+            db.execute(f"DELETE FROM {self.TABLE}")
+            db.execute("UPDATE stats SET value = 0")
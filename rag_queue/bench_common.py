@@ -0,0 +1,7 @@
+"""Helpers shared by the benchmark scripts (bench_*.py)."""
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
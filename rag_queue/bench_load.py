@@ -0,0 +1,76 @@
+"""
+Load test for the rag_queue API.
+
+Opens CONCURRENCY client connections against a running server and keeps each
+one busy for DURATION seconds, then reports requests/sec and latency
+percentiles. Start the server (`python main.py`) and Redis first.
+
+    python bench_load.py [--url http://localhost:8000] [--concurrency 1000]
+                         [--duration 20] [--endpoint result|chat]
+
+`result` polls GET /result/ for a fixed job id (pure API + Redis path),
+`chat` posts distinct queries to POST /chat/ (enqueue path). Worker
+throughput is deliberately not part of this measurement.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+from bench_common import percentile
+
+
+async def client_loop(client, endpoint, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if endpoint == "chat":
+                response = await client.post("/chat/", params={"query": f"load test {uuid.uuid4()}"})
+            else:
+                response = await client.get("/result/", params={"job_id": "load-test"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            errors.append(time.perf_counter() - start)
+
+
+async def run(url, concurrency, duration, endpoint):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, errors = [], []
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[
+            client_loop(client, endpoint, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    print(f"endpoint:     {endpoint}")
+    print(f"concurrency:  {concurrency}")
+    print(f"requests:     {len(latencies)} ok, {len(errors)} failed in {elapsed:.1f}s")
+    if latencies:
+        print(f"throughput:   {len(latencies) / elapsed:.0f} req/s")
+        print(f"latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+        print(f"latency p99:  {percentile(latencies, 99) * 1000:.1f} ms")
+        print(f"latency max:  {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--endpoint", choices=["result", "chat"], default="result")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.concurrency, args.duration, args.endpoint))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Interactive latency under bulk load.
+
+Runs against a live stack (Redis, Qdrant, `python main.py` and at least one
+worker). First it measures end-to-end latency of interactive questions on
+their own, then again while another tenant pushes bulk batches into the batch
+lane. With weighted lanes and per-tenant admission the two p95 numbers should
+stay close.
+
+    python bench_priority.py [--url http://localhost:8000] [--questions 50]
+                             [--bulk 2000]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+from bench_common import percentile
+
+QUESTION = "What is the event loop in Node.js?"
+
+
+async def ask(client):
+    start = time.perf_counter()
+    # A unique suffix keeps single-flight from joining earlier jobs
+    response = await client.post(
+        "/chat/",
+        params={"query": f"{QUESTION} ({uuid.uuid4().hex[:6]})"},
+        headers={"X-Tenant-ID": "interactive-bench"},
+    )
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+
+    while True:
+        result = (await client.get("/result/wait", params={"job_id": job_id, "timeout": 60})).json()
+        if "status" not in result:
+            return time.perf_counter() - start
+
+
+async def interactive_phase(client, questions):
+    latencies = []
+    for _ in range(questions):
+        latencies.append(await ask(client))
+    return latencies
+
+
+async def bulk_load(client, total, stop):
+    sent = 0
+    while sent < total and not stop.is_set():
+        size = min(500, total - sent)
+        response = await client.post(
+            "/chat/batch",
+            json={"queries": [f"bulk question {uuid.uuid4()}" for _ in range(size)]},
+            headers={"X-Tenant-ID": "bulk-bench"},
+        )
+        if response.status_code == 429:
+            # Tenant is at its limit, which is exactly what admission control is for
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+            continue
+        response.raise_for_status()
+        sent += size
+    return sent
+
+
+def report(name, latencies):
+    print(
+        f"{name:>12}: p50 {statistics.median(latencies):6.2f}s  "
+        f"p95 {percentile(latencies, 95):6.2f}s  max {max(latencies):6.2f}s  ({len(latencies)} questions)"
+    )
+
+
+async def run(url, questions, bulk):
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        baseline = await interactive_phase(client, questions)
+
+        stop = asyncio.Event()
+        bulk_task = asyncio.create_task(bulk_load(client, bulk, stop))
+        loaded = await interactive_phase(client, questions)
+        stop.set()
+        sent = await bulk_task
+
+    report("idle", baseline)
+    report("under bulk", loaded)
+    print(f"bulk jobs submitted during the second phase: {sent}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--bulk", type=int, default=2000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.questions, args.bulk))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Redis memory used by finished jobs, pickle vs zstd-compressed JSON.
+
+Writes N finished jobs (job hash + result stream entry, like a worker would)
+into a scratch Redis database once with RQ's default pickle serializer and
+once with ZstdJSONSerializer, and reports `used_memory` per scenario.
+The scratch database is flushed before and after each scenario.
+
+    python bench_result_memory.py [--jobs 100000] [--db 15]
+"""
+
+import argparse
+
+from redis import Redis
+from redis.connection import parse_url
+from rq import Queue
+from rq.results import Result
+from rq.serializers import DefaultSerializer
+
+from client.result_store import ZstdJSONSerializer
+from client.rq_client import REDIS_URL
+
+QUESTION = "How do readable streams handle backpressure in Node.js?"
+
+# Roughly the shape of a real answer: a few paragraphs with page citations
+ANSWER = "\n\n".join(
+    f"Readable streams buffer data internally until it is consumed (Page {page}). "
+    f"When the internal buffer reaches highWaterMark, push() returns false and the "
+    f"source should stop reading until the 'drain' event is emitted (Page {page + 1}). "
+    f"Piping with stream.pipeline() handles this automatically and forwards errors (Page {page + 2})."
+    for page in range(12, 60, 8)
+)
+
+
+def used_memory(connection):
+    return connection.info("memory")["used_memory"]
+
+
+def fill(connection, serializer, jobs, batch=1000):
+    queue = Queue("bench", connection=connection, serializer=serializer)
+    for start in range(0, jobs, batch):
+        with connection.pipeline() as pipeline:
+            for i in range(start, min(start + batch, jobs)):
+                job = queue.create_job("queues.worker.process_query", args=(f"{QUESTION} #{i}",))
+                job.save(pipeline=pipeline)
+                Result(
+                    job_id=job.id,
+                    type=Result.Type.SUCCESSFUL,
+                    connection=connection,
+                    return_value=ANSWER,
+                    serializer=serializer,
+                ).save(ttl=3600, pipeline=pipeline)
+            pipeline.execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--db", type=int, default=15, help="scratch database, flushed by this script")
+    args = parser.parse_args()
+
+    # The database in REDIS_URL would win over a db= argument, so override it explicitly
+    connection = Redis(**{**parse_url(REDIS_URL), "db": args.db})
+    print(f"answer size: {len(ANSWER.encode())} bytes, jobs per scenario: {args.jobs}")
+
+    for name, serializer in (("pickle", DefaultSerializer), ("zstd-json", ZstdJSONSerializer)):
+        connection.flushdb()
+        before = used_memory(connection)
+        fill(connection, serializer, args.jobs)
+        after = used_memory(connection)
+        connection.flushdb()
+
+        encoded = len(serializer.dumps(ANSWER))
+        total_mb = (after - before) / 1024 / 1024
+        print(
+            f"{name:>10}: {total_mb:8.1f} MB for {args.jobs} jobs "
+            f"({(after - before) / args.jobs:7.0f} bytes/job, answer encodes to {encoded} bytes)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Cold start benchmark for the API process.
+
+Each run starts a fresh interpreter and times how long it takes until the
+FastAPI app is importable:
+
+  before: the API also imports the worker and builds its embedding model,
+          Qdrant connection and LLM client (what server.py used to do)
+  after:  the API only imports server.py and enqueues jobs by dotted path
+
+Run it from the rag_queue directory:
+
+    python bench_startup.py [runs]
+"""
+
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).parent
+
+SCENARIOS = {
+    "before": (
+        "import time; t = time.perf_counter(); "
+        "import server; import queues.worker as w; w.warm_up(); "
+        "print(time.perf_counter() - t)"
+    ),
+    "after": (
+        "import time; t = time.perf_counter(); "
+        "import server; "
+        "print(time.perf_counter() - t)"
+    ),
+}
+
+
+def time_scenario(code: str, runs: int):
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+        )
+        if out.returncode != 0:
+            return None, out.stderr.strip().splitlines()[-1]
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings, None
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    for name, code in SCENARIOS.items():
+        timings, error = time_scenario(code, runs)
+        if error:
+            print(f"{name:>6}: failed to start ({error})")
+            continue
+        print(
+            f"{name:>6}: median {statistics.median(timings) * 1000:8.1f} ms  "
+            f"min {min(timings) * 1000:8.1f} ms  max {max(timings) * 1000:8.1f} ms  ({runs} runs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Per-tenant admission control.
+
+Every tenant gets a bounded number of pending jobs per lane, tracked in
+`rag:pending:<lane>:<tenant>`. The API admits a request only if it fits under
+the limit (atomically, in Lua), and the worker releases the slot when the job
+finishes or fails. One tenant's 10k-question batch therefore can't fill a lane
+on its own, and interactive traffic is never queued behind it.
+"""
+
+import os
+
+TENANT_HEADER = "X-Tenant-ID"
+DEFAULT_TENANT = "anonymous"
+
+LIMITS = {
+    "interactive": int(os.getenv("RAG_TENANT_MAX_INTERACTIVE", "20")),
+    "batch": int(os.getenv("RAG_TENANT_MAX_BATCH", "2000")),
+    "background": int(os.getenv("RAG_TENANT_MAX_BACKGROUND", "2000")),
+}
+
+# Counters are refreshed on every admit; if a worker dies without releasing,
+# the slots come back once the tenant has been quiet for this long.
+COUNTER_TTL = 3600
+
+ADMIT_SCRIPT = """
+local pending = redis.call('INCRBY', KEYS[1], ARGV[1])
+if pending > tonumber(ARGV[2]) then
+    redis.call('DECRBY', KEYS[1], ARGV[1])
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def pending_key(lane: str, tenant: str) -> str:
+    return f"rag:pending:{lane}:{tenant}"
+
+
+async def admit(connection, lane: str, tenant: str, count: int = 1) -> bool:
+    """Reserve `count` slots for the tenant in this lane. False means over the limit."""
+    admitted = await connection.eval(ADMIT_SCRIPT, 1, pending_key(lane, tenant), count, LIMITS[lane], COUNTER_TTL)
+    return bool(admitted)
+
+
+def release(connection, lane: str, tenant: str, count: int = 1):
+    """Give slots back once jobs are done. Works with a plain connection or a pipeline."""
+    connection.decrby(pending_key(lane, tenant), count)
+
+
+async def pending(connection, lane: str, tenant: str) -> int:
+    value = await connection.get(pending_key(lane, tenant))
+    return int(value) if value else 0
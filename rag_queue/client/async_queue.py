@@ -0,0 +1,90 @@
+"""
+asyncio front end for the RQ queue.
+
+RQ only speaks synchronous Redis. Its enqueue path does not read anything
+back when given a pipeline; it only buffers commands. An asyncio pipeline
+buffers commands the same way, so we let RQ fill one and execute it with a
+single await. Job state and results are read straight from the keys RQ
+writes (`rq:job:<id>` and the `rq:results:<id>` stream), plus the
+`result_evicted` field result_store.py adds to jobs whose result it evicted.
+"""
+
+from rq.job import Job
+from rq.results import Result
+
+from client.result_store import SERIALIZER
+
+
+async def enqueue(queue, async_connection, func, *args, **kwargs):
+    """Like `queue.enqueue`, but the Redis round trip happens on the asyncio connection."""
+    job = queue.create_job(func, args=args, **kwargs)
+    async with async_connection.pipeline() as pipeline:
+        queue.enqueue_job(job, pipeline=pipeline)
+        await pipeline.execute()
+    return job
+
+
+async def enqueue_many(queue, async_connection, func, calls, group_key=None, group_ttl=None):
+    """
+    Enqueue one job per (args, kwargs) pair in a single pipelined round trip.
+    When `group_key` is given the job ids are also pushed to that list, in the
+    same round trip, so the group can be looked up later.
+    """
+    jobs = [queue.create_job(func, args=args, **kwargs) for args, kwargs in calls]
+    async with async_connection.pipeline() as pipeline:
+        for job in jobs:
+            queue.enqueue_job(job, pipeline=pipeline)
+        if group_key is not None:
+            pipeline.rpush(group_key, *[job.id for job in jobs])
+            if group_ttl:
+                pipeline.expire(group_key, group_ttl)
+        await pipeline.execute()
+    return jobs
+
+
+# A finished job whose answer is gone: evicted for space (result_store.py) or expired
+EVICTED = {"error": "Result evicted to make room for newer ones, submit the query again.", "evicted": True}
+EXPIRED = {"error": "Result expired.", "expired": True}
+
+
+async def job_states(async_connection, job_ids: list[str], serializer=SERIALIZER):
+    """job_state for many jobs, with one pipelined round trip for statuses and one for results."""
+    async with async_connection.pipeline(transaction=False) as pipeline:
+        for job_id in job_ids:
+            pipeline.hmget(Job.key_for(job_id), "status", "result_evicted")
+        fields = await pipeline.execute()
+
+    finished = [job_id for job_id, (status, evicted) in zip(job_ids, fields) if status == b"finished" and evicted is None]
+    async with async_connection.pipeline(transaction=False) as pipeline:
+        for job_id in finished:
+            pipeline.xrevrange(Result.get_key(job_id), "+", "-", count=1)
+        responses = await pipeline.execute()
+
+    results = {}
+    for job_id, response in zip(finished, responses):
+        if response:
+            result_id, payload = response[0]
+            result = Result.restore(job_id, result_id.decode(), payload, connection=None, serializer=serializer)
+            if result.type == Result.Type.SUCCESSFUL:
+                results[job_id] = result.return_value
+
+    states = {}
+    for job_id, (status, evicted) in zip(job_ids, fields):
+        if status is None:
+            states[job_id] = {"error": "Job not found."}
+        elif evicted is not None:
+            states[job_id] = dict(EVICTED)
+        elif job_id in results:
+            states[job_id] = {"result": results[job_id]}
+        elif status == b"finished":
+            states[job_id] = dict(EXPIRED)
+        elif status == b"failed":
+            states[job_id] = {"error": "Job failed."}
+        else:
+            states[job_id] = None
+    return states
+
+
+async def job_state(async_connection, job_id: str):
+    """Current state of a job as a response dict, or None while it is still pending."""
+    return (await job_states(async_connection, [job_id]))[job_id]
@@ -0,0 +1,30 @@
+"""
+RQ job callbacks attached by the API at enqueue time.
+
+They run in the worker after a job finishes: publish the completion for
+push-based result delivery, account for the stored result's size and give
+the tenant's admission slot back.
+"""
+
+from rq.defaults import DEFAULT_RESULT_TTL
+
+from client import admission
+from client.notifications import publish_result
+from client.result_store import track_result
+
+
+def release_slot(job, connection):
+    tenant = job.meta.get("tenant")
+    if tenant is not None:
+        admission.release(connection, job.origin, tenant)
+
+
+def on_success(job, connection, result, *args, **kwargs):
+    publish_result(connection, job.id, "finished", result=result)
+    track_result(connection, job.id, result, job.get_result_ttl(DEFAULT_RESULT_TTL))
+    release_slot(job, connection)
+
+
+def on_failure(job, connection, type, value, traceback):
+    publish_result(connection, job.id, "failed", error="Job failed.")
+    release_slot(job, connection)
@@ -0,0 +1,119 @@
+"""
+Pipeline metrics shared by the worker (writes) and the API (reads).
+
+The worker times each stage of a job (queue wait, embedding, cache lookup,
+Qdrant search, reranking, prompt assembly, LLM call, time to first token) in a Trace.
+When the job ends the trace is folded into per-stage histograms
+(`rag:metrics:hist:<stage>`) and token counters (`rag:metrics:counters`),
+and kept under `rag:trace:<job_id>` so `/result/?trace=true` can show where
+an individual slow job spent its time. `/metrics` renders everything in the
+Prometheus text format.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGES = ("queue_wait", "embed", "cache_lookup", "search", "rerank", "prompt", "llm", "first_token", "total")
+HIST_PREFIX = "rag:metrics:hist:"
+COUNTERS_KEY = "rag:metrics:counters"
+TRACE_PREFIX = "rag:trace:"
+
+
+def trace_key(job_id: str) -> str:
+    return f"{TRACE_PREFIX}{job_id}"
+
+
+class Trace:
+    def __init__(self, job_id: str = None):
+        self.job_id = job_id
+        self.stages = {}
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.started = time.perf_counter()
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def to_dict(self):
+        return {
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+        }
+
+    def save(self, connection, ttl: int):
+        """Fold this trace into the shared histograms. Works with a connection or a pipeline."""
+        self.record("total", time.perf_counter() - self.started)
+
+        for stage, seconds in self.stages.items():
+            key = f"{HIST_PREFIX}{stage}"
+            bucket = next((str(bound) for bound in BUCKETS if seconds <= bound), "+Inf")
+            connection.hincrby(key, bucket, 1)
+            connection.hincrby(key, "count", 1)
+            connection.hincrbyfloat(key, "sum", seconds)
+
+        connection.hincrby(COUNTERS_KEY, "tokens_in", self.tokens_in)
+        connection.hincrby(COUNTERS_KEY, "tokens_out", self.tokens_out)
+
+        if self.job_id is not None:
+            connection.set(trace_key(self.job_id), json.dumps(self.to_dict()), ex=ttl)
+
+
+async def read_trace(async_connection, job_id: str):
+    raw = await async_connection.get(trace_key(job_id))
+    return json.loads(raw) if raw else None
+
+
+async def render_prometheus(async_connection, queue_keys: dict):
+    """Prometheus text exposition of stage histograms, token counters and queue depth."""
+    async with async_connection.pipeline(transaction=False) as pipeline:
+        for stage in STAGES:
+            pipeline.hgetall(f"{HIST_PREFIX}{stage}")
+        pipeline.hgetall(COUNTERS_KEY)
+        for key in queue_keys.values():
+            pipeline.llen(key)
+        responses = await pipeline.execute()
+
+    histograms = responses[:len(STAGES)]
+    counters = {k.decode(): int(v) for k, v in responses[len(STAGES)].items()}
+    depths = responses[len(STAGES) + 1:]
+
+    lines = [
+        "# HELP rag_stage_seconds Time spent in each stage of the RAG pipeline.",
+        "# TYPE rag_stage_seconds histogram",
+    ]
+    for stage, raw in zip(STAGES, histograms):
+        values = {k.decode(): v for k, v in raw.items()}
+        cumulative = 0
+        for bound in BUCKETS:
+            cumulative += int(values.get(str(bound), 0))
+            lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        cumulative += int(values.get("+Inf", 0))
+        lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+        lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {float(values.get("sum", 0))}')
+        lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {int(values.get("count", 0))}')
+
+    lines += [
+        "# HELP rag_llm_tokens_total Prompt and completion tokens reported by the LLM.",
+        "# TYPE rag_llm_tokens_total counter",
+        f'rag_llm_tokens_total{{direction="in"}} {counters.get("tokens_in", 0)}',
+        f'rag_llm_tokens_total{{direction="out"}} {counters.get("tokens_out", 0)}',
+        "# HELP rag_queue_depth Jobs waiting in each lane.",
+        "# TYPE rag_queue_depth gauge",
+    ]
+    for lane, depth in zip(queue_keys, depths):
+        lines.append(f'rag_queue_depth{{lane="{lane}"}} {depth}')
+
+    return "\n".join(lines) + "\n"
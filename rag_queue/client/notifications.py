@@ -0,0 +1,78 @@
+"""
+Job completion notifications over Redis pub/sub.
+
+The worker publishes one message per finished job on `rag:job-done:<job_id>`.
+The API process keeps a single pattern subscription open and wakes up the
+requests that are waiting on that job, so clients no longer have to poll
+`/result/`.
+"""
+
+import asyncio
+import json
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+CHANNEL_PREFIX = "rag:job-done:"
+
+
+def channel_for(job_id: str) -> str:
+    return f"{CHANNEL_PREFIX}{job_id}"
+
+
+def publish_result(connection, job_id: str, status: str, result=None, error=None):
+    payload = {"job_id": job_id, "status": status}
+    if result is not None:
+        payload["result"] = result
+    if error is not None:
+        payload["error"] = error
+    connection.publish(channel_for(job_id), json.dumps(payload))
+
+
+class ResultListener:
+    """Fans pub/sub completion messages out to the asyncio tasks waiting on them."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.waiters: dict[str, set[asyncio.Future]] = {}
+        self._task = None
+        self._pubsub = None
+
+    async def start(self):
+        self._pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+        self._task = asyncio.create_task(self._reader())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._pubsub:
+            await self._pubsub.aclose()
+
+    async def _reader(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    payload = json.loads(message["data"])
+                    for future in self.waiters.pop(payload["job_id"], ()):
+                        if not future.done():
+                            future.set_result(payload)
+            except (ConnectionError, TimeoutError):
+                # Waiters fall back to their timeout; resubscribe once Redis is back
+                await asyncio.sleep(1)
+                await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+
+    def subscribe(self, job_id: str) -> asyncio.Future:
+        """Register interest in a job. Call before checking its current state to avoid missing the message."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(job_id, set()).add(future)
+        return future
+
+    def unsubscribe(self, job_id: str, future: asyncio.Future):
+        futures = self.waiters.get(job_id)
+        if futures is None:
+            return
+        futures.discard(future)
+        if not futures:
+            del self.waiters[job_id]
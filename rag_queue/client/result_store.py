@@ -0,0 +1,130 @@
+"""
+Compact, bounded storage for job results.
+
+* ZstdJSONSerializer replaces RQ's default pickle serializer for job data and
+  return values: answers are plain strings, so JSON plus zstd is both safe to
+  load and smaller than a pickle of the same text.
+* Result and failure TTLs are configured per lane (RAG_RESULT_TTL_<LANE>,
+  RAG_FAILURE_TTL_<LANE>) and applied at enqueue time.
+* RAG_MAX_RESULT_BYTES caps the total size of stored answers. Every stored
+  result is recorded in `rag:{results}:sizes`; once the total goes over the
+  cap the results closest to expiring anyway are deleted first, and their
+  jobs get a `result_evicted` field so readers can tell them apart from jobs
+  that finished with an empty answer.
+
+Workers have to use the same serializer, e.g.
+`rq worker --serializer client.result_store.ZstdJSONSerializer interactive batch background`.
+"""
+
+import json
+import os
+import time
+
+import zstandard
+from rq.job import Job
+from rq.results import Result
+
+_compressor = zstandard.ZstdCompressor(level=3)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+class ZstdJSONSerializer:
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return _compressor.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def loads(data, *args, **kwargs):
+        return json.loads(_decompressor.decompress(data).decode("utf-8"))
+
+
+SERIALIZER = ZstdJSONSerializer
+
+RESULT_TTLS = {
+    "interactive": int(os.getenv("RAG_RESULT_TTL_INTERACTIVE", "600")),
+    # Offline evaluations collect their answers later
+    "batch": int(os.getenv("RAG_RESULT_TTL_BATCH", "86400")),
+    "background": int(os.getenv("RAG_RESULT_TTL_BACKGROUND", "3600")),
+}
+FAILURE_TTLS = {
+    "interactive": int(os.getenv("RAG_FAILURE_TTL_INTERACTIVE", "3600")),
+    "batch": int(os.getenv("RAG_FAILURE_TTL_BATCH", "86400")),
+    "background": int(os.getenv("RAG_FAILURE_TTL_BACKGROUND", "86400")),
+}
+
+# 0 disables the cap
+MAX_RESULT_BYTES = int(os.getenv("RAG_MAX_RESULT_BYTES", str(256 * 1024 * 1024)))
+
+# Hash-tagged so the script's two keys share a slot on Redis Cluster
+SIZES_KEY = "rag:{results}:sizes"
+TOTAL_KEY = "rag:{results}:bytes"
+
+# KEYS: sizes zset, total counter. ARGV: job id, size, now, ttl, cap.
+# Members are "<job_id>:<size>" scored by expiry time, so entries RQ already
+# expired can be subtracted without a separate size lookup. Returns the ids
+# of the results to evict; the script only touches its declared keys, the
+# results themselves are deleted by evict_results().
+TRACK_SCRIPT = """
+local function forget(members)
+    for _, member in ipairs(members) do
+        local size = tonumber(string.match(member, ':(%d+)$'))
+        redis.call('ZREM', KEYS[1], member)
+        redis.call('DECRBY', KEYS[2], size)
+    end
+end
+
+forget(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[3]))
+
+redis.call('ZADD', KEYS[1], ARGV[3] + ARGV[4], ARGV[1] .. ':' .. ARGV[2])
+local total = redis.call('INCRBY', KEYS[2], ARGV[2])
+
+local evicted = {}
+local cap = tonumber(ARGV[5])
+while cap > 0 and total > cap do
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0)
+    if #oldest == 0 then break end
+    forget(oldest)
+    total = tonumber(redis.call('GET', KEYS[2]))
+    table.insert(evicted, string.match(oldest[1], '^(.*):%d+$'))
+end
+return evicted
+"""
+
+# KEYS: job hash. ARGV: eviction time. A job that already expired is left
+# alone rather than recreated with just this field.
+MARK_EVICTED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'result_evicted', ARGV[1])
+end
+"""
+
+
+def result_options(lane: str):
+    """Enqueue kwargs for a lane's result and failure retention."""
+    return dict(result_ttl=RESULT_TTLS[lane], failure_ttl=FAILURE_TTLS[lane])
+
+
+def track_result(connection, job_id: str, result, ttl: int):
+    """Account for a newly stored result and evict the oldest ones above MAX_RESULT_BYTES."""
+    track_results(connection, [(job_id, result, ttl)])
+
+
+def track_results(connection, results):
+    """track_result for many (job id, result, ttl) triples, with one round trip unless something is evicted."""
+    with connection.pipeline(transaction=False) as pipeline:
+        for job_id, result, ttl in results:
+            size = len(SERIALIZER.dumps(result))
+            pipeline.eval(TRACK_SCRIPT, 2, SIZES_KEY, TOTAL_KEY, job_id, size, time.time(), ttl, MAX_RESULT_BYTES)
+        evicted = [job_id for job_ids in pipeline.execute() for job_id in job_ids]
+    if evicted:
+        evict_results(connection, [job_id.decode() if isinstance(job_id, bytes) else job_id for job_id in evicted])
+
+
+def evict_results(connection, job_ids):
+    """Delete the stored results of these jobs and mark the jobs as evicted."""
+    with connection.pipeline(transaction=False) as pipeline:
+        for job_id in job_ids:
+            # Mark first, so the job is never finished without either result or mark
+            pipeline.eval(MARK_EVICTED_SCRIPT, 1, Job.key_for(job_id), int(time.time()))
+            pipeline.delete(Result.get_key(job_id))
+        pipeline.execute()
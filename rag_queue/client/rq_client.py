@@ -1,7 +1,35 @@
-from redis import Redis
+import os
+
+from redis import BlockingConnectionPool, Redis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis
 from rq import Queue
 
-redis_conn = Redis(host='localhost', port=6379, db=0)
+from client.result_store import SERIALIZER
+
+# Connection pool settings, shared by the sync (RQ) and async (API) clients
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+# Seconds to wait for a free connection when the pool is exhausted
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+
+pool_options = dict(
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+)
+
+redis_conn = Redis(connection_pool=BlockingConnectionPool.from_url(REDIS_URL, **pool_options))
+
+# Used by the API, which talks to Redis only through asyncio
+async_redis_conn = AsyncRedis(connection_pool=AsyncBlockingConnectionPool.from_url(REDIS_URL, **pool_options))
 
-queue = Queue(connection=redis_conn)
+# Priority lanes. Workers drain them in weighted order (see queues/scheduling.py)
+LANES = ("interactive", "batch", "background")
+queues = {lane: Queue(lane, connection=redis_conn, serializer=SERIALIZER) for lane in LANES}
 
+# Lane used when nothing else is asked for
+queue = queues["interactive"]
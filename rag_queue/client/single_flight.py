@@ -0,0 +1,80 @@
+"""
+Single-flight coalescing for identical queries.
+
+The first request for a normalized query claims `rag:inflight:<hash>` with
+its job id. Until the key expires, identical queries get that job id back
+instead of enqueuing a new job, so a burst of N identical questions costs one
+embedding, one search and one LLM call.
+
+A claim is taken over only when its job failed or its result was evicted
+(result_store.py), or when the job still doesn't exist CLAIM_GRACE_SECONDS
+after the claim (the claimer died, or the job expired). Just after a claim
+the job is legitimately missing, because the claimer hasn't enqueued it yet.
+Check and takeover run atomically in Lua, so concurrent requests always
+agree on one job.
+"""
+
+import hashlib
+import os
+import re
+
+from rq.job import Job
+
+KEY_PREFIX = "rag:inflight:"
+# How long a job stays joinable after it was enqueued (0 disables coalescing)
+WINDOW_SECONDS = int(os.getenv("RAG_SINGLE_FLIGHT_SECONDS", "300"))
+# How long a claim may point at a job that hasn't been enqueued yet
+CLAIM_GRACE_SECONDS = int(os.getenv("RAG_SINGLE_FLIGHT_GRACE_SECONDS", "10"))
+
+CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local job = redis.call('HMGET', ARGV[4] .. current, 'status', 'result_evicted')
+    local status, evicted = job[1], job[2]
+    local age = tonumber(ARGV[2]) - redis.call('TTL', KEYS[1])
+    if status == 'failed' or evicted or (not status and age >= tonumber(ARGV[3])) then
+        current = false
+    end
+end
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return ARGV[1]
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def flight_key(query: str) -> str:
+    digest = hashlib.sha256(normalize_query(query).encode()).hexdigest()
+    return f"{KEY_PREFIX}{digest}"
+
+
+async def claim(connection, query: str, job_id: str) -> str:
+    """
+    Try to make `job_id` the job for this query. Returns the job id that holds
+    the claim: `job_id` itself when the caller should enqueue, otherwise the
+    existing job to join.
+    """
+    if WINDOW_SECONDS <= 0:
+        return job_id
+
+    winner = await connection.eval(
+        CLAIM_SCRIPT, 1, flight_key(query), job_id, WINDOW_SECONDS, CLAIM_GRACE_SECONDS, Job.redis_job_namespace_prefix
+    )
+    return winner.decode() if isinstance(winner, bytes) else winner
+
+
+async def release(connection, query: str, job_id: str):
+    """Drop the claim if it still points at `job_id`, e.g. because the job was never enqueued."""
+    await connection.eval(RELEASE_SCRIPT, 1, flight_key(query), job_id)
@@ -0,0 +1,75 @@
+"""
+Per-job token streams.
+
+While generating, the worker appends each completion delta to the Redis
+stream `rag:job-tokens:<job_id>` and finishes it with a `done` (or `error`)
+entry. The API reads the stream with blocking XREAD and forwards entries to
+the client as they arrive.
+"""
+
+import json
+import time
+
+STREAM_PREFIX = "rag:job-tokens:"
+# Streams only need to outlive the request that is reading them
+STREAM_TTL = 600
+# Each XREAD blocks at most this long, so it stays under the pool's socket timeout
+READ_BLOCK_MS = 1000
+
+
+def stream_key(job_id: str) -> str:
+    return f"{STREAM_PREFIX}{job_id}"
+
+
+class TokenWriter:
+    def __init__(self, connection, job_id: str):
+        self.connection = connection
+        self.key = stream_key(job_id)
+        self._started = False
+
+    def write(self, delta: str):
+        with self.connection.pipeline(transaction=False) as pipeline:
+            pipeline.xadd(self.key, {"delta": delta})
+            if not self._started:
+                pipeline.expire(self.key, STREAM_TTL)
+            pipeline.execute()
+        self._started = True
+
+    def close(self, error: str = None):
+        fields = {"error": error} if error else {"done": "1"}
+        with self.connection.pipeline(transaction=False) as pipeline:
+            pipeline.xadd(self.key, fields)
+            pipeline.expire(self.key, STREAM_TTL)
+            pipeline.execute()
+
+
+async def read_tokens(connection, job_id: str, idle_timeout: float):
+    """
+    Yield (event, data) tuples for a job's token stream, starting from the
+    beginning so late readers still get the whole answer. Stops after the
+    final entry or when nothing arrives for `idle_timeout` seconds.
+    """
+    key = stream_key(job_id)
+    last_id = "0"
+    deadline = time.monotonic() + idle_timeout
+
+    while True:
+        response = await connection.xread({key: last_id}, block=READ_BLOCK_MS, count=100)
+        if not response:
+            if time.monotonic() >= deadline:
+                yield "timeout", json.dumps({"status": "Job is still processing."})
+                return
+            continue
+        deadline = time.monotonic() + idle_timeout
+
+        for entry_id, fields in response[0][1]:
+            last_id = entry_id
+            fields = {k.decode(): v.decode() for k, v in fields.items()}
+            if "delta" in fields:
+                yield "token", json.dumps({"delta": fields["delta"]})
+            elif "error" in fields:
+                yield "error", json.dumps({"error": fields["error"]})
+                return
+            else:
+                yield "done", json.dumps({"status": "done"})
+                return
@@ -0,0 +1,188 @@
+"""
+Micro-batching worker for the RAG queue.
+
+Instead of running one `process_query` job at a time like `rq worker`, this
+worker pulls up to RAG_BATCH_SIZE pending jobs (waiting at most
+RAG_BATCH_MAX_WAIT_MS for the batch to fill up), embeds all the queries in a
+single call, runs one Qdrant batch search and then writes each answer back to
+its own RQ job, so `/result/` keeps working unchanged. Jobs are taken from
+the priority lanes in weighted order (queues/scheduling.py).
+
+It is an rq Worker otherwise: it registers and heartbeats like one, and
+batched jobs are in their lane's StartedJobRegistry while they run, for at
+most their job timeout. If the worker dies mid-batch, rq's registry cleanup
+fails them and their on_failure callbacks give the admission slots back.
+Jobs that aren't a plain `process_query` call run through the normal forked
+work horse path.
+
+Run it from the rag_queue directory:
+
+    python -m queues.batch_worker
+"""
+
+import os
+import time
+import traceback
+
+from rq.defaults import DEFAULT_WORKER_TTL
+from rq.exceptions import DequeueTimeout
+from rq.executions import Execution
+from rq.job import JobStatus
+from rq.results import Result
+from rq.timeouts import JobTimeoutException
+from rq.utils import now
+from rq.worker import WorkerStatus
+
+from client import admission
+from client.rq_client import LANES, redis_conn
+from client.metrics import Trace
+from client.notifications import publish_result
+from client.result_store import SERIALIZER, track_results
+from client.token_stream import TokenWriter
+from queues.scheduling import WeightedWorker, lane_queues, weighted_order
+from queues.worker import process_queries, warm_up
+
+BATCH_SIZE = int(os.getenv("RAG_BATCH_SIZE", "16"))
+BATCH_MAX_WAIT_MS = int(os.getenv("RAG_BATCH_MAX_WAIT_MS", "20"))
+RESULT_TTL = 500
+
+# The function the API enqueues; anything else isn't batched
+PROCESS_QUERY = "queues.worker.process_query"
+
+
+def batchable(job) -> bool:
+    return job.func_name == PROCESS_QUERY and len(job.args) == 1 and not job.kwargs
+
+
+class BatchWorker(WeightedWorker):
+    """
+    WeightedWorker that runs process_query jobs in batches. rq's work loop
+    blocks for the first job as usual; execute_job() then fills the batch.
+    """
+
+    def dequeue(self, timeout):
+        """One job from the lanes in weighted order; timeout None doesn't block."""
+        try:
+            return self.queue_class.dequeue_any(
+                weighted_order(self.queues), timeout, connection=self.connection,
+                job_class=self.job_class, serializer=self.serializer,
+            )
+        except DequeueTimeout:
+            return None
+
+    def collect_batch(self, first):
+        """
+        Take what is already queued without blocking; once the lanes are empty,
+        block for whatever is left of the wait window. Stops early at a job that
+        can't be batched and returns it separately.
+        """
+        batch = [first]
+        deadline = time.monotonic() + BATCH_MAX_WAIT_MS / 1000
+        while len(batch) < BATCH_SIZE:
+            result = self.dequeue(None)
+            remaining = deadline - time.monotonic()
+            if result is None and remaining > 0:
+                result = self.dequeue(remaining)
+            if result is None:
+                break
+            if not batchable(result[0]):
+                return batch, result
+            batch.append(result[0])
+        return batch, None
+
+    def execute_job(self, job, queue):
+        if not batchable(job):
+            super().execute_job(job, queue)
+            return
+        batch, other = self.collect_batch(job)
+        self.execute_batch(batch)
+        if other is not None:
+            super().execute_job(*other)
+
+    def batch_timeout(self, jobs) -> int:
+        timeouts = [job.timeout or self.queue_class.DEFAULT_TIMEOUT for job in jobs]
+        return -1 if -1 in timeouts else max(timeouts)
+
+    def mark_started(self, jobs, ttl):
+        """Register the jobs as started, with an expiry instead of heartbeats, like rq's SimpleWorker."""
+        with self.connection.pipeline() as pipeline:
+            self.set_state(WorkerStatus.BUSY, pipeline=pipeline)
+            self.heartbeat(ttl, pipeline=pipeline)
+            executions = [Execution.create(job, ttl, pipeline=pipeline) for job in jobs]
+            for job in jobs:
+                job.prepare_for_execution(self.name, pipeline=pipeline)
+                # With a single queue dequeue_any parks job ids in RQ's intermediate queue
+                if len(self.queues) == 1:
+                    pipeline.lrem(self.queues[0].intermediate_queue_key, 1, job.id)
+            pipeline.execute()
+        return executions
+
+    def execute_batch(self, jobs):
+        timeout = self.batch_timeout(jobs)
+        # Nothing heartbeats while the batch runs, so the registrations have to outlive it
+        executions = self.mark_started(jobs, DEFAULT_WORKER_TTL if timeout == -1 else timeout + 60)
+
+        queries = [job.args[0] for job in jobs]
+        traces = []
+        for job in jobs:
+            trace = Trace(job.id)
+            trace.record("queue_wait", (job.started_at - job.enqueued_at).total_seconds())
+            traces.append(trace)
+
+        start = time.perf_counter()
+        try:
+            # alarm(0) means no time limit
+            with self.death_penalty_class(max(timeout, 0), JobTimeoutException, job_id=jobs[0].id):
+                outcomes = process_queries(queries, job_ids=[job.id for job in jobs], traces=traces)
+        except Exception as e:
+            # Embedding or search failed for the whole batch, or it ran out of time
+            outcomes = [e] * len(jobs)
+            for job in jobs:
+                TokenWriter(self.connection, job.id).close(error="Job failed.")
+        elapsed = time.perf_counter() - start
+
+        self.mark_done(jobs, executions, outcomes, traces)
+        self.set_state(WorkerStatus.IDLE)
+        print(f"[{self.name}] processed {len(jobs)} jobs in {elapsed:.2f}s")
+
+    def mark_done(self, jobs, executions, outcomes, traces):
+        stored = []
+        with self.connection.pipeline() as pipeline:
+            for job, execution, outcome, trace in zip(jobs, executions, outcomes, traces):
+                job.ended_at = now()
+                execution.delete(job, pipeline=pipeline)
+                self.increment_total_working_time(job.ended_at - job.started_at, pipeline)
+                if isinstance(outcome, Exception):
+                    exc_string = "".join(traceback.format_exception(outcome))
+                    job.set_status(JobStatus.FAILED, pipeline=pipeline)
+                    job.failed_job_registry.add(job, ttl=job.failure_ttl, exc_string=exc_string, pipeline=pipeline)
+                    Result.create_failure(job, job.failure_ttl, exc_string=exc_string, worker_name=self.name, pipeline=pipeline)
+                    self.increment_failed_job_count(pipeline=pipeline)
+                    publish_result(pipeline, job.id, "failed", error="Job failed.")
+                else:
+                    result_ttl = job.get_result_ttl(RESULT_TTL)
+                    job.set_status(JobStatus.FINISHED, pipeline=pipeline)
+                    Result.create(job, Result.Type.SUCCESSFUL, ttl=result_ttl, return_value=outcome, worker_name=self.name, pipeline=pipeline)
+                    self.increment_successful_job_count(pipeline=pipeline)
+                    job.finished_job_registry.add(job, result_ttl, pipeline=pipeline)
+                    publish_result(pipeline, job.id, "finished", result=outcome)
+                    stored.append((job.id, outcome, result_ttl))
+                if job.meta.get("tenant") is not None:
+                    admission.release(pipeline, job.origin, job.meta["tenant"])
+                trace.save(pipeline, job.get_result_ttl(RESULT_TTL))
+                job.save(pipeline=pipeline, include_meta=False, include_result=False)
+            pipeline.execute()
+        # Needs the results in place, and its own round trip to act on evictions
+        track_results(self.connection, stored)
+
+
+def run():
+    # Resources are built once here and inherited by the work horses of unbatched jobs
+    warm_up()
+    worker = BatchWorker(lane_queues(), connection=redis_conn, serializer=SERIALIZER)
+    print(f"[{worker.name}] listening on {', '.join(LANES)} (batch size {BATCH_SIZE}, max wait {BATCH_MAX_WAIT_MS}ms)")
+    worker.work()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+"""
+Weighted draining of the priority lanes.
+
+Before every dequeue the lanes are put in a weighted random order, so a lane
+with weight 8 is tried first eight times as often as one with weight 1. Empty
+lanes are skipped by RQ as usual, which means interactive jobs are picked up
+almost immediately while batch and background work still makes progress.
+
+Weights come from RAG_LANE_WEIGHTS, e.g. "interactive=8,batch=2,background=1".
+"""
+
+import os
+import random
+
+from rq import Worker
+
+from client.rq_client import LANES, queues
+
+
+def parse_weights(spec: str):
+    weights = {lane: 1.0 for lane in LANES}
+    for part in filter(None, spec.split(",")):
+        lane, _, weight = part.partition("=")
+        weights[lane.strip()] = float(weight)
+    return weights
+
+
+LANE_WEIGHTS = parse_weights(os.getenv("RAG_LANE_WEIGHTS", "interactive=8,batch=2,background=1"))
+
+
+def weighted_order(lane_queues):
+    """Weighted random permutation (Efraimidis-Spirakis)."""
+    return sorted(
+        lane_queues,
+        key=lambda q: random.random() ** (1.0 / LANE_WEIGHTS.get(q.name, 1.0)),
+        reverse=True,
+    )
+
+
+def lane_queues():
+    return [queues[lane] for lane in LANES]
+
+
+class WeightedWorker(Worker):
+    """rq Worker that reorders its queues by LANE_WEIGHTS before every dequeue."""
+
+    def reorder_queues(self, reference_queue):
+        self._ordered_queues = weighted_order(self.queues)
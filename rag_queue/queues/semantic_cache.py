@@ -0,0 +1,206 @@
+"""
+Semantic answer cache for the RAG worker.
+
+Answers are stored in their own Qdrant collection next to the query embedding
+and the ids of the chunks they were built from. A new query whose embedding
+is within RAG_SEMANTIC_CACHE_THRESHOLD cosine similarity of a cached one gets
+the cached answer, so paraphrases ("how do streams work in node" vs "explain
+node.js streams") skip retrieval and the LLM call.
+
+Entries expire after RAG_SEMANTIC_CACHE_TTL seconds and the least recently
+used ones are evicted once there are more than RAG_SEMANTIC_CACHE_MAX_ENTRIES.
+Re-indexing `learning_rag_gemini` must drop the cache, which rag/index.py does
+by deleting the cache collection (or run `python -m queues.semantic_cache
+invalidate`).
+
+Hit rate, latency saved and memory footprint are kept in the Redis hash
+`rag:semcache:stats` so any process can report them.
+"""
+
+import json
+import os
+import sys
+import time
+import uuid
+
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    OrderBy,
+    PayloadSchemaType,
+    PointStruct,
+    Range,
+    VectorParams,
+)
+
+ENABLED = os.getenv("RAG_SEMANTIC_CACHE", "1") == "1"
+THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = int(os.getenv("RAG_SEMANTIC_CACHE_TTL", "86400"))
+MAX_ENTRIES = int(os.getenv("RAG_SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+COLLECTION_NAME = "learning_rag_gemini_answer_cache"
+STATS_KEY = "rag:semcache:stats"
+
+
+class SemanticCache:
+    def __init__(self, qdrant_client, redis_conn, dimension: int):
+        self.qdrant = qdrant_client
+        self.redis = redis_conn
+        self.dimension = dimension
+        self._ready = False
+
+    def _ensure_collection(self):
+        if self._ready:
+            return
+        if not self.qdrant.collection_exists(COLLECTION_NAME):
+            self.qdrant.create_collection(
+                collection_name=COLLECTION_NAME,
+                vectors_config=VectorParams(size=self.dimension, distance=Distance.COSINE),
+            )
+            self.qdrant.create_payload_index(COLLECTION_NAME, "expires_at", PayloadSchemaType.FLOAT)
+            self.qdrant.create_payload_index(COLLECTION_NAME, "last_used", PayloadSchemaType.FLOAT)
+        self._ready = True
+
+    def lookup(self, embedding: list[float]):
+        """Return the cached answer for the closest query above the threshold, or None."""
+        start = time.perf_counter()
+        try:
+            self._ensure_collection()
+            now = time.time()
+            response = self.qdrant.query_points(
+                collection_name=COLLECTION_NAME,
+                query=embedding,
+                limit=1,
+                score_threshold=THRESHOLD,
+                query_filter=Filter(must=[FieldCondition(key="expires_at", range=Range(gt=now))]),
+                with_payload=True,
+            )
+
+            if not response.points:
+                self.redis.hincrby(STATS_KEY, "misses", 1)
+                return None
+
+            point = response.points[0]
+            self.qdrant.set_payload(COLLECTION_NAME, payload={"last_used": now}, points=[point.id], wait=False)
+
+            saved = point.payload["compute_seconds"] - (time.perf_counter() - start)
+            with self.redis.pipeline(transaction=False) as pipeline:
+                pipeline.hincrby(STATS_KEY, "hits", 1)
+                pipeline.hincrbyfloat(STATS_KEY, "saved_seconds", max(saved, 0.0))
+                pipeline.execute()
+            return point.payload["answer"]
+        except Exception as e:
+            # The cache must never take the query path down with it
+            print(f"[semcache] lookup failed: {e}")
+            self._ready = False
+            return None
+
+    def store(self, query: str, embedding: list[float], answer: str, chunk_ids: list, compute_seconds: float):
+        try:
+            self._ensure_collection()
+            now = time.time()
+            payload = {
+                "query": query,
+                "answer": answer,
+                "chunk_ids": [str(chunk_id) for chunk_id in chunk_ids],
+                "compute_seconds": compute_seconds,
+                "created_at": now,
+                "last_used": now,
+                "expires_at": now + TTL_SECONDS,
+            }
+            self.qdrant.upsert(
+                collection_name=COLLECTION_NAME,
+                points=[PointStruct(id=str(uuid.uuid4()), vector=embedding, payload=payload)],
+            )
+            self.redis.hincrby(STATS_KEY, "payload_bytes", len(json.dumps(payload)))
+            self.redis.hincrby(STATS_KEY, "stored", 1)
+            self.evict()
+        except Exception as e:
+            print(f"[semcache] store failed: {e}")
+            self._ready = False
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above MAX_ENTRIES."""
+        self.qdrant.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=FilterSelector(
+                filter=Filter(must=[FieldCondition(key="expires_at", range=Range(lte=time.time()))])
+            ),
+            wait=False,
+        )
+
+        entries = self.qdrant.count(COLLECTION_NAME, exact=False).count
+        # Last known size, for processes without a Qdrant client (the API's /cache/stats)
+        self.redis.hset(STATS_KEY, mapping={"entries": min(entries, MAX_ENTRIES), "dimension": self.dimension})
+        overflow = entries - MAX_ENTRIES
+        if overflow > 0:
+            oldest, _ = self.qdrant.scroll(
+                collection_name=COLLECTION_NAME,
+                limit=overflow,
+                order_by=OrderBy(key="last_used", direction="asc"),
+                with_payload=False,
+            )
+            self.qdrant.delete(COLLECTION_NAME, points_selector=[p.id for p in oldest], wait=False)
+
+    def invalidate(self):
+        """Forget every cached answer, e.g. after the source collection was re-indexed."""
+        if self.qdrant.collection_exists(COLLECTION_NAME):
+            self.qdrant.delete_collection(COLLECTION_NAME)
+        self._ready = False
+        self.redis.delete(STATS_KEY)
+
+    def stats(self):
+        return cache_stats(self.redis, self.qdrant, self.dimension)
+
+
+def memory_bytes(raw: dict, entries: int, dimension: int) -> int:
+    """float32 vectors plus the average stored payload, per entry."""
+    stored = raw.get("stored", 0)
+    avg_payload = raw.get("payload_bytes", 0) / stored if stored else 0
+    return int(entries * (dimension * 4 + avg_payload))
+
+
+def summarize_stats(raw_hash: dict):
+    """
+    Hit rate, latency saved and memory footprint from the raw `rag:semcache:stats`
+    hash. The entry count is the one a worker saw at its last store.
+    """
+    raw = {k.decode(): float(v) for k, v in raw_hash.items()}
+    hits, misses = raw.get("hits", 0), raw.get("misses", 0)
+    entries = int(raw.get("entries", 0))
+    return {
+        "hits": int(hits),
+        "misses": int(misses),
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "saved_seconds": round(raw.get("saved_seconds", 0.0), 3),
+        "entries": entries,
+        "memory_bytes": memory_bytes(raw, entries, int(raw.get("dimension", 768))),
+    }
+
+
+def cache_stats(redis_conn, qdrant_client=None, dimension: int = 768):
+    """summarize_stats, with the live entry count when a Qdrant client is at hand."""
+    raw_hash = redis_conn.hgetall(STATS_KEY)
+    stats = summarize_stats(raw_hash)
+
+    if qdrant_client is not None and qdrant_client.collection_exists(COLLECTION_NAME):
+        raw = {k.decode(): float(v) for k, v in raw_hash.items()}
+        entries = qdrant_client.count(COLLECTION_NAME, exact=False).count
+        stats["entries"] = entries
+        stats["memory_bytes"] = memory_bytes(raw, entries, dimension)
+
+    return stats
+
+
+if __name__ == "__main__":
+    from queues.worker import get_semantic_cache
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = get_semantic_cache()
+    if command == "invalidate":
+        cache.invalidate()
+        print("Semantic cache cleared.")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
@@ -1,58 +1,365 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_qdrant import QdrantVectorStore
+from qdrant_client.models import QueryRequest
 from openai import OpenAI
+from rq import get_current_job
+from rq.defaults import DEFAULT_RESULT_TTL
+from rq.utils import now
 from dotenv import load_dotenv
+from pathlib import Path
 import os
+import sys
+import time
+
+from client.metrics import Trace
+from client.rq_client import redis_conn
+from client.token_stream import TokenWriter
+from queues import semantic_cache
+from queues.semantic_cache import SemanticCache
+
+# Retrieval helpers shared with the rag/ scripts
+sys.path.append(str(Path(__file__).resolve().parents[2] / "rag"))
+from context_packing import get_encoding, pack_context
+from embedding_cache import CachedEmbeddings
+from lexical import CANDIDATES, HYBRID, LexicalIndex, fuse, hybrid_search
+from local_store import VECTOR_BACKEND, LocalVectorStore
+from quantization import qdrant_search_params
+from rerank import make_reranker, retrieve_k
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 
-# Set API key for Gemini embeddings
-os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+# Number of chunks retrieved per query (same as similarity_search's default)
+SEARCH_K = 4
 
-# Embedding model
-embedding_model = GoogleGenerativeAIEmbeddings(
-    model="models/text-embedding-004"
-)
+# models/text-embedding-004 produces 768-dimensional vectors
+EMBEDDING_DIMENSION = 768
 
-# Load existing Qdrant vector collection
-vector_store = QdrantVectorStore.from_existing_collection(
-    url=QDRANT_URL,
-    collection_name="learning_rag_gemini",
-    embedding=embedding_model,
-)
+# The answer cache is a Qdrant collection, so it needs the Qdrant backend
+SEMANTIC_CACHE = semantic_cache.ENABLED and VECTOR_BACKEND == "qdrant"
+# Oversampling and float32 rescoring when the collection is quantized (RAG_QUANTIZATION)
+SEARCH_PARAMS = qdrant_search_params()
 
-# Gemini OpenAI-Compatible Client
-client = OpenAI(
-    api_key=GOOGLE_API_KEY,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
+# Embedding model, vector store and LLM client are built on first use so that
+# importing this module (e.g. from the API process) stays cheap.
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    # Set API key for Gemini embeddings
+    os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+    # Repeated questions skip the API via the cache shared with rag/
+    return CachedEmbeddings(GoogleGenerativeAIEmbeddings(
+        model="models/text-embedding-004"
+    ))
 
-def process_query(query: str):
-    search_results = vector_store.similarity_search(query=query)
 
-    context = "\n\n\n".join([
-        f"Page Content: {r.page_content}\n"
-        f"Page Number: {r.metadata.get('page_label')}\n"
-        f"File Location: {r.metadata.get('source')}"
-        for r in search_results
-    ])
+@lru_cache(maxsize=None)
+def get_vector_store():
+    if VECTOR_BACKEND == "local":
+        # Memory-mapped index in rag/local_index, shared by forked work horses
+        return LocalVectorStore.open("learning_rag_gemini", get_embedding_model())
+    # Load existing Qdrant vector collection
+    return QdrantVectorStore.from_existing_collection(
+        url=QDRANT_URL,
+        collection_name="learning_rag_gemini",
+        embedding=get_embedding_model(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_lexical_index():
+    # BM25 index written by rag/index.py; restart workers after re-indexing
+    return LexicalIndex.load("learning_rag_gemini") if HYBRID else None
+
+
+@lru_cache(maxsize=None)
+def get_reranker():
+    # Shares the BM25 index's idf; None with RAG_RERANK=none
+    return make_reranker(get_lexical_index())
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    # Gemini OpenAI-Compatible Client
+    return OpenAI(
+        api_key=GOOGLE_API_KEY,
+        base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_semantic_cache():
+    return SemanticCache(get_vector_store().client, redis_conn, EMBEDDING_DIMENSION)
+
+
+def warm_up():
+    """Build every resource up front, e.g. in a worker parent before it forks."""
+    get_embedding_model()
+    get_vector_store()
+    get_lexical_index()
+    get_reranker()
+    get_client()
+    # tiktoken downloads o200k_base on first use; pack_context needs it for every answer
+    get_encoding()
+
 
-    SYSTEM_PROMPT = f"""
+def generate_answer(query: str, search_results, job_id: str = None, trace: Trace = None) -> str:
+    """
+    Ask the LLM to answer from the retrieved chunks. When a job id is given the
+    completion is streamed and every delta is published to that job's token
+    stream as it arrives. Stage timings and token usage go into `trace`.
+    """
+    trace = trace or Trace()
+
+    with trace.stage("prompt"):
+        search_results = pack_context(search_results)
+        context = "\n\n\n".join([
+            f"Page Content: {r.page_content}\n"
+            f"Page Number: {r.metadata.get('page_label')}\n"
+            f"File Location: {r.metadata.get('source')}"
+            for r in search_results
+        ])
+
+        SYSTEM_PROMPT = f"""
     You are a helpful AI Assistant who answers user queries based ONLY on the context retrieved from the PDF.
     Always cite the page number.
 
     Context: {context}
     """
 
-    response = client.chat.completions.create(
-        model="gemini-2.5-flash",
-        messages=[
+        messages = [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": query},
+        ]
+
+    if job_id is None:
+        with trace.stage("llm"):
+            response = get_client().chat.completions.create(
+                model="gemini-2.5-flash",
+                messages=messages,
+            )
+        record_usage(trace, response.usage)
+        return response.choices[0].message.content
+
+    writer = TokenWriter(redis_conn, job_id)
+    parts = []
+    start = time.perf_counter()
+    try:
+        stream = get_client().chat.completions.create(
+            model="gemini-2.5-flash",
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            # With include_usage the last chunk carries the token counts and no choices
+            record_usage(trace, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    trace.record("first_token", time.perf_counter() - start)
+                parts.append(delta)
+                writer.write(delta)
+    except Exception:
+        writer.close(error="Job failed.")
+        raise
+    finally:
+        trace.record("llm", time.perf_counter() - start)
+
+    writer.close()
+    return "".join(parts)
+
+
+def record_usage(trace: Trace, usage):
+    if usage is not None:
+        trace.tokens_in += usage.prompt_tokens or 0
+        trace.tokens_out += usage.completion_tokens or 0
+
+
+def chunk_ids(search_results):
+    return [r.metadata.get("_id") for r in search_results]
+
+
+def replay_cached(answer: str, job_id: str = None):
+    """Serve a cached answer through the job's token stream like a generated one."""
+    if job_id is not None:
+        writer = TokenWriter(redis_conn, job_id)
+        writer.write(answer)
+        writer.close()
+    return answer
+
+
+def process_query(query: str):
+    job = get_current_job()
+    job_id = job.id if job else None
+    trace = Trace(job_id)
+    if job is not None and job.enqueued_at is not None:
+        trace.record("queue_wait", (now() - job.enqueued_at).total_seconds())
+
+    try:
+        # Embed once and reuse the vector for the cache lookup and the search
+        with trace.stage("embed"):
+            embedding = get_embedding_model().embed_query(query)
+
+        cache = get_semantic_cache() if SEMANTIC_CACHE else None
+        if cache is not None:
+            with trace.stage("cache_lookup"):
+                cached = cache.lookup(embedding)
+            if cached is not None:
+                return replay_cached(cached, job_id)
+
+        start = time.perf_counter()
+        with trace.stage("search"):
+            # Vector and BM25 results fused (plain vector search with RAG_HYBRID=0)
+            search_results = hybrid_search(
+                get_vector_store(), get_lexical_index(), query, embedding, k=retrieve_k(SEARCH_K),
+                search_params=SEARCH_PARAMS,
+            )
+        search_results = rerank(query, search_results, trace)
+        answer = generate_answer(query, search_results, job_id=job_id, trace=trace)
+
+        if cache is not None:
+            cache.store(query, embedding, answer, chunk_ids(search_results), time.perf_counter() - start)
+        return answer
+    finally:
+        trace.save(redis_conn, job.get_result_ttl(DEFAULT_RESULT_TTL) if job else DEFAULT_RESULT_TTL)
+        flush_cache_stats()
+
+
+def flush_cache_stats():
+    # rq work horses exit with os._exit, which skips the caches' atexit flush
+    get_embedding_model().cache.flush_stats()
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.cache.flush_stats()
+
+
+def rerank(query: str, search_results, trace: Trace):
+    """Keep the reranker's best chunks (RAG_RERANK); search_results unchanged when it is off."""
+    reranker = get_reranker()
+    if reranker is None:
+        return search_results
+    with trace.stage("rerank"):
+        return reranker.rerank(query, search_results)
+
+
+def search_k():
+    # Hybrid retrieval fuses a longer vector candidate list with the BM25 results
+    return max(CANDIDATES, retrieve_k(SEARCH_K)) if get_lexical_index() is not None else retrieve_k(SEARCH_K)
+
+
+def search_many(vectors: list[list[float]], k: int = SEARCH_K):
+    """
+    Retrieve chunks for several query embeddings with one Qdrant batch search.
+    Returns one list of Documents per vector.
+    """
+    vector_store = get_vector_store()
+    if VECTOR_BACKEND == "local":
+        return vector_store.similarity_search_by_vector_batch(vectors, k=k)
+
+    responses = vector_store.client.query_batch_points(
+        collection_name=vector_store.collection_name,
+        requests=[
+            QueryRequest(
+                query=vector,
+                using=vector_store.vector_name,
+                limit=k,
+                params=SEARCH_PARAMS,
+                with_payload=True,
+            )
+            for vector in vectors
         ],
     )
 
-    return response.choices[0].message.content
\ No newline at end of file
+    return [
+        [
+            QdrantVectorStore._document_from_point(
+                point,
+                vector_store.collection_name,
+                vector_store.content_payload_key,
+                vector_store.metadata_payload_key,
+            )
+            for point in response.points
+        ]
+        for response in responses
+    ]
+
+
+def process_queries(queries: list[str], job_ids: list[str] = None, traces: list[Trace] = None):
+    """
+    Batched version of process_query. All queries are embedded in one call,
+    the ones not answered by the semantic cache share one Qdrant batch search,
+    and the LLM calls run concurrently. Each item in the returned list is
+    either the answer string or the exception raised for that query.
+
+    Shared stages (embedding, search) are recorded in every query's trace with
+    the full batch time, since that is what each query waited for. Saving the
+    traces is left to the caller.
+    """
+    job_ids = job_ids or [None] * len(queries)
+    traces = traces or [Trace(job_id) for job_id in job_ids]
+
+    start = time.perf_counter()
+    vectors = get_embedding_model().embed_documents(queries, task_type="RETRIEVAL_QUERY")
+    for trace in traces:
+        trace.record("embed", time.perf_counter() - start)
+    outcomes = [None] * len(queries)
+
+    cache = get_semantic_cache() if SEMANTIC_CACHE else None
+    pending = []
+    for i, vector in enumerate(vectors):
+        cached = None
+        if cache is not None:
+            with traces[i].stage("cache_lookup"):
+                cached = cache.lookup(vector)
+        if cached is not None:
+            outcomes[i] = replay_cached(cached, job_ids[i])
+        else:
+            pending.append(i)
+
+    if not pending:
+        return outcomes
+
+    start = time.perf_counter()
+    all_results = search_many([vectors[i] for i in pending], k=search_k())
+    all_results = [
+        fuse(queries[i], dense, get_lexical_index(), retrieve_k(SEARCH_K)) for i, dense in zip(pending, all_results)
+    ]
+    search_seconds = time.perf_counter() - start
+    for i in pending:
+        traces[i].record("search", search_seconds)
+
+    def safe_answer(args):
+        i, search_results = args
+        try:
+            llm_start = time.perf_counter()
+            search_results = rerank(queries[i], search_results, traces[i])
+            answer = generate_answer(queries[i], search_results, job_id=job_ids[i], trace=traces[i])
+            if cache is not None:
+                compute_seconds = search_seconds + time.perf_counter() - llm_start
+                cache.store(queries[i], vectors[i], answer, chunk_ids(search_results), compute_seconds)
+            return answer
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+        for i, outcome in zip(pending, pool.map(safe_answer, zip(pending, all_results))):
+            outcomes[i] = outcome
+
+    return outcomes
+
+
+if __name__ == "__main__":
+    # Same as `rq worker`, but the resources are built once in the parent and
+    # inherited by every forked work horse instead of being rebuilt per job.
+    from client.result_store import SERIALIZER
+    from client.rq_client import redis_conn
+    from queues.scheduling import WeightedWorker, lane_queues
+
+    warm_up()
+    WeightedWorker(lane_queues(), connection=redis_conn, serializer=SERIALIZER).work()
@@ -1,26 +1,217 @@
-from fastapi import FastAPI, Query
-from client.rq_client import queue
-from queues.worker import process_query
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, Header, HTTPException, Query
+from pydantic import BaseModel, Field
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from rq.job import Callback
+from client.rq_client import queues, async_redis_conn
+from client import admission, async_queue, metrics, single_flight
+from client.result_store import result_options
+from client.notifications import ResultListener
+from client.token_stream import read_tokens
+
+# Jobs are enqueued by dotted path so the API never imports the worker module
+# (and its embedding model, Qdrant connection and LLM client).
+PROCESS_QUERY = "queues.worker.process_query"
+
+# Upper bound for how long /result/wait and /result/stream hold a request open
+MAX_WAIT_SECONDS = 60
+
+# Clients retry rejected submissions after this many seconds
+RETRY_AFTER_SECONDS = 5
+
+Lane = Literal["interactive", "batch", "background"]
+
+# Bulk submissions: largest accepted batch and how long its job list is kept
+MAX_BATCH_QUERIES = 1000
+BATCH_TTL = 86400
+
+listener = ResultListener(async_redis_conn)
+
+
+class BatchChatRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    lane: Lane = "batch"
+
+
+def job_options(lane: str, tenant: str):
+    return dict(
+        meta={"tenant": tenant},
+        **result_options(lane),
+        on_success=Callback("client.callbacks.on_success"),
+        on_failure=Callback("client.callbacks.on_failure"),
+    )
+
+
+def too_many_pending(lane: str, tenant: str):
+    return HTTPException(
+        status_code=429,
+        detail=f"Tenant '{tenant}' has too many pending {lane} jobs.",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def batch_key(batch_id: str) -> str:
+    return f"rag:batch:{batch_id}"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # RQ looks up the server version once per queue; do it now, off the event loop
+    for lane_queue in queues.values():
+        await run_in_threadpool(lane_queue.get_redis_server_version)
+    await listener.start()
+    yield
+    await listener.stop()
+    await async_redis_conn.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def to_response(payload: dict):
+    if payload["status"] == "finished":
+        return {"result": payload["result"]}
+    return {"error": payload.get("error", "Job failed.")}
+
+
+async def wait_for_job(job_id: str, timeout: float):
+    # Subscribe before looking at the job so a completion in between is not lost
+    future = listener.subscribe(job_id)
+    try:
+        state = await async_queue.job_state(async_redis_conn, job_id)
+        if state is not None:
+            return state
+        payload = await asyncio.wait_for(future, timeout=timeout)
+        return to_response(payload)
+    except asyncio.TimeoutError:
+        return {"status": "Job is still processing."}
+    finally:
+        listener.unsubscribe(job_id, future)
 
-app = FastAPI()
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Message": "Server is running."}
 
 @app.post("/chat/")
-def chat(query: str = Query(..., description="The user query to process.")):
-    job = queue.enqueue(process_query, query)
+async def chat(
+    query: str = Query(..., description="The user query to process."),
+    lane: Lane = Query("interactive", description="Priority lane to enqueue the job on."),
+    tenant: str = Header(admission.DEFAULT_TENANT, alias=admission.TENANT_HEADER),
+):
+    job_id = str(uuid.uuid4())
+
+    # Either our job id or the one an identical query already claimed
+    claimed_id = await single_flight.claim(async_redis_conn, query, job_id)
+    if claimed_id != job_id:
+        return {"job_id": claimed_id, "status": "Joined existing job."}
+
+    if not await admission.admit(async_redis_conn, lane, tenant):
+        await single_flight.release(async_redis_conn, query, job_id)
+        raise too_many_pending(lane, tenant)
+
+    job = await async_queue.enqueue(
+        queues[lane],
+        async_redis_conn,
+        PROCESS_QUERY,
+        query,
+        job_id=job_id,
+        **job_options(lane, tenant),
+    )
     return {"job_id": job.id, "status": "Job enqueued."}
 
+@app.post("/chat/batch")
+async def chat_batch(
+    request: BatchChatRequest,
+    tenant: str = Header(admission.DEFAULT_TENANT, alias=admission.TENANT_HEADER),
+):
+    if not await admission.admit(async_redis_conn, request.lane, tenant, count=len(request.queries)):
+        raise too_many_pending(request.lane, tenant)
+
+    batch_id = str(uuid.uuid4())
+    # Enqueued back to back in one round trip, so the batch worker tends to
+    # pick them up together and embed/search them in a single call
+    jobs = await async_queue.enqueue_many(
+        queues[request.lane],
+        async_redis_conn,
+        PROCESS_QUERY,
+        [((query,), job_options(request.lane, tenant)) for query in request.queries],
+        group_key=batch_key(batch_id),
+        group_ttl=BATCH_TTL,
+    )
+    return {
+        "batch_id": batch_id,
+        "job_ids": [job.id for job in jobs],
+        "status": f"{len(jobs)} jobs enqueued.",
+    }
+
+@app.get("/result/batch")
+async def get_batch_result(batch_id: str = Query(..., description="The batch ID returned by /chat/batch.")):
+    job_ids = [job_id.decode() for job_id in await async_redis_conn.lrange(batch_key(batch_id), 0, -1)]
+    if not job_ids:
+        return {"error": "Batch not found."}
+
+    states = await async_queue.job_states(async_redis_conn, job_ids)
+    results = [
+        {"job_id": job_id, **(state or {"status": "Job is still processing."})}
+        for job_id, state in states.items()
+    ]
+    return {
+        "batch_id": batch_id,
+        "total": len(job_ids),
+        "done": sum(1 for state in states.values() if state is not None),
+        "results": results,
+    }
+
 @app.get("/result/")
-def get_result(job_id: str = Query(..., description="The job ID to fetch the result for.")):
-    job = queue.fetch_job(job_id)
-    if job is None:
-        return {"error": "Job not found."}
-    if job.is_finished:
-        return {"result": job.result}
-    elif job.is_failed:
-        return {"error": "Job failed."}
-    else:
-        return {"status": "Job is still processing."} 
\ No newline at end of file
+async def get_result(
+    job_id: str = Query(..., description="The job ID to fetch the result for."),
+    trace: bool = Query(False, description="Include per-stage timings and token counts of the job."),
+):
+    state = await async_queue.job_state(async_redis_conn, job_id)
+    if state is None:
+        state = {"status": "Job is still processing."}
+    if trace:
+        state["trace"] = await metrics.read_trace(async_redis_conn, job_id)
+    return state
+
+@app.get("/result/wait")
+async def wait_result(
+    job_id: str = Query(..., description="The job ID to wait for."),
+    timeout: float = Query(30, gt=0, le=MAX_WAIT_SECONDS, description="Seconds to wait before giving up."),
+):
+    return await wait_for_job(job_id, timeout)
+
+@app.get("/result/stream")
+async def stream_result(job_id: str = Query(..., description="The job ID to stream the result for.")):
+    async def events():
+        state = await wait_for_job(job_id, MAX_WAIT_SECONDS)
+        event = "pending" if "status" in state else "result"
+        yield f"event: {event}\ndata: {json.dumps(state)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/result/tokens")
+async def stream_tokens(job_id: str = Query(..., description="The job ID to stream answer tokens for.")):
+    async def events():
+        async for event, data in read_tokens(async_redis_conn, job_id, MAX_WAIT_SECONDS):
+            yield f"event: {event}\ndata: {data}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    # Imported here so the API only loads the Qdrant models when this is called
+    from queues.semantic_cache import STATS_KEY, summarize_stats
+
+    return summarize_stats(await async_redis_conn.hgetall(STATS_KEY))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    queue_keys = {lane: lane_queue.key for lane, lane_queue in queues.items()}
+    return await metrics.render_prometheus(async_redis_conn, queue_keys)